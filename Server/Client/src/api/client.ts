@@ -41,12 +41,23 @@ export interface TopicFrequency {
   percentage: number
 }
 
+export interface TopicForecast {
+  topic: string
+  score: number
+  appearances: number
+  last_seen: string
+  mean_gap: number | null
+  overdue: boolean
+  expected_mark_share: number
+}
+
 export interface AnalysisResult {
   session_id: string
   total_questions: number
   topics: TopicFrequency[]
   year_distribution: Record<string, number>
   predicted_topics: string[]
+  topic_forecast: TopicForecast[]
   pattern_insights: string[]
   all_questions: {
     question: string
@@ -113,16 +124,19 @@ export const getMe = async (): Promise<User> => {
 }
 
 // Existing methods
-export const uploadFiles = async (files: File[], apiKey?: string): Promise<UploadResponse> => {
+export const uploadFiles = async (files: File[], apiKey?: string, sessionId?: string): Promise<UploadResponse> => {
   const formData = new FormData()
   files.forEach(f => formData.append('files', f))
   if (apiKey) formData.append('api_key', apiKey)
+  // Append to an existing session instead of starting a new one
+  if (sessionId) formData.append('session_id', sessionId)
   const { data } = await api.post('/upload', formData)
   return data
 }
 
-export const analyzePapers = async (sessionId: string): Promise<AnalysisResult> => {
-  const { data } = await api.post('/analyze', { session_id: sessionId })
+export const analyzePapers = async (sessionId: string, speculative?: boolean): Promise<AnalysisResult> => {
+  // speculative: pre-generate the paper, answers and PDFs in the background
+  const { data } = await api.post('/analyze', { session_id: sessionId, speculative })
   return data
 }
 
@@ -136,6 +150,30 @@ export const getAnswers = async (sessionId: string): Promise<AnswerSet> => {
   return data
 }
 
+export interface Page<T> {
+  items: T[]
+  next_cursor: number | null
+  total: number
+}
+
+export const getAnalyzedQuestions = async (
+  sessionId: string,
+  cursor = 0,
+  limit = 50
+): Promise<Page<AnalysisResult['all_questions'][number]>> => {
+  const { data } = await api.get(`/analysis/${sessionId}/questions`, { params: { cursor, limit } })
+  return data
+}
+
+export const getAnsweredQuestions = async (
+  sessionId: string,
+  cursor = 0,
+  limit = 50
+): Promise<Page<AnsweredQuestion>> => {
+  const { data } = await api.get(`/answers/${sessionId}/questions`, { params: { cursor, limit } })
+  return data
+}
+
 export const downloadQuestionPDF = async (sessionId: string) => {
   try {
     const { data } = await api.get(`/pdf/questions/${sessionId}`, {
@@ -0,0 +1,85 @@
+"""Import-time and startup benchmark for the API.
+
+Run from the Server directory:
+
+    python benchmarks/startup_bench.py --runs 5 --max-import 1.5 --max-startup 2.0
+
+Each run uses a fresh interpreter. Exits non-zero if a budget is exceeded or a
+heavy module is imported eagerly again, so it can guard against regressions.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only load on first use
+LAZY_MODULES = ["fitz", "reportlab", "PIL", "openai", "numpy"]
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter() - started
+
+from fastapi.testclient import TestClient
+started = time.perf_counter()
+with TestClient(main.app) as client:
+    client.get("/health/live")
+    live = time.perf_counter() - started
+
+print(json.dumps({
+    "import": imported,
+    "startup": live,
+    "eager": [m for m in %r if m in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def run_once() -> dict:
+    # Point the DB at nothing reachable; startup must not wait for it
+    env = {**os.environ, "WARMUP": "0", "DB_HOST": os.environ.get("BENCH_DB_HOST", "127.0.0.1"), "DB_PORT": "1"}
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=SERVER_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import", type=float, default=None, help="median import budget in seconds")
+    parser.add_argument("--max-startup", type=float, default=None, help="median startup budget in seconds")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    import_median = statistics.median(r["import"] for r in runs)
+    startup_median = statistics.median(r["startup"] for r in runs)
+    eager = sorted({m for r in runs for m in r["eager"]})
+
+    print(f"import main:       median {import_median * 1000:.0f} ms over {args.runs} runs")
+    print(f"startup to live:   median {startup_median * 1000:.0f} ms")
+    print(f"eagerly imported:  {', '.join(eager) if eager else 'none'}")
+
+    failures = []
+    if eager:
+        failures.append(f"heavy modules imported at startup: {', '.join(eager)}")
+    if args.max_import is not None and import_median > args.max_import:
+        failures.append(f"import took {import_median:.2f}s (budget {args.max_import:.2f}s)")
+    if args.max_startup is not None and startup_median > args.max_startup:
+        failures.append(f"startup took {startup_median:.2f}s (budget {args.max_startup:.2f}s)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
+import logging
 import psycopg2
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+SCHEMA_NAME = "AI_Question_Analyzer_greaterdig"
+
+logger = logging.getLogger(__name__)
+
 def get_db_connection():
     conn = psycopg2.connect(
         host=os.getenv("DB_HOST"),
@@ -19,8 +24,7 @@ def init_db():
     cur = conn.cursor()
     
     # Use the dedicated schema for this user
-    schema_name = "AI_Question_Analyzer_greaterdig"
-    cur.execute(f"SET search_path TO {schema_name};")
+    cur.execute(f"SET search_path TO {SCHEMA_NAME};")
 
     # Create users table
     cur.execute("""
@@ -32,11 +36,42 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
     """)
-    
+
+    # Persistent question corpus, private to the user who analyzed the papers,
+    # deduplicated per user by a hash of question text, subject and year, and
+    # searchable through a generated full-text column
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS questions (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            content_hash CHAR(64) NOT NULL,
+            subject VARCHAR(255),
+            year VARCHAR(32),
+            topic VARCHAR(255),
+            section VARCHAR(64),
+            marks INTEGER,
+            question TEXT NOT NULL,
+            search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', question)) STORED,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, content_hash)
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS questions_search_idx ON questions USING GIN (search_vector);")
+    cur.execute("CREATE INDEX IF NOT EXISTS questions_subject_year_idx ON questions (user_id, subject, year);")
+
+    # Analyses of previously seen papers, keyed by a hash of their extracted text
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS paper_analyses (
+            content_hash CHAR(64) PRIMARY KEY,
+            analysis JSONB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
     conn.commit()
     cur.close()
     conn.close()
-    print("Database initialized successfully.")
+    logger.info("Database initialized successfully.")
 
 if __name__ == "__main__":
     init_db()
@@ -1,35 +1,88 @@
+import asyncio
+import logging
+import os
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from routers import upload, analyze, generate, answers, pdf_export, auth
+from services.logging_setup import configure_logging, shutdown_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+from routers import upload, analyze, generate, answers, pdf_export, auth, corpus, profiles
 from database import init_db
+from services import metrics, executors
+from services.admission import pipeline_admission, speculative_admission
+from services.model_router import recent_decisions
+from services.warmup import WARMUP_ENABLED, warmup
 
 app = FastAPI(
     title="Question Analyzer & Suggester API",
     description="AI-powered question paper analysis and prediction system",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
+# Readiness is reported once the schema exists (and warmup ran, if enabled)
+app.state.ready = False
+
+# Backoff between schema initialization attempts while the database is unreachable
+INIT_RETRY_MAX_SECONDS = float(os.getenv("INIT_RETRY_MAX_SECONDS", "30"))
+
+
+async def _initialize():
+    delay = 1.0
+    attempt = 1
+    while True:
+        try:
+            await executors.run_in("db", init_db)
+            break
+        except Exception as e:
+            logger.error("Database initialization failed (attempt %d), retrying in %.0fs: %s", attempt, delay, e)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, INIT_RETRY_MAX_SECONDS)
+        attempt += 1
+
+    if WARMUP_ENABLED:
+        try:
+            timings = await asyncio.to_thread(warmup)
+            logger.info("Warmup complete", extra={"timings": timings})
+        except Exception as e:
+            logger.warning("Warmup failed, continuing without it: %s", e)
+
+    app.state.ready = True
+
+
 @app.on_event("startup")
 async def startup_event():
-    # Force schema creation on startup
-    init_db()
+    # Create the schema off the event loop so the worker starts serving immediately
+    app.state.init_task = asyncio.create_task(_initialize())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.init_task.cancel()
+    executors.shutdown()
+    shutdown_logging()
 
 app.include_router(auth.router, prefix="/api")
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
-    print(f"Validation Error: {exc.errors()}")
-    print(f"Body: {await request.body()}")
-    return JSONResponse(
-        status_code=422,
-        content={"detail": exc.errors(), "body": str(await request.body())},
+    # Never read or echo the body: it can be a multi-megabyte upload. The offending
+    # input values are left out of the response for the same reason.
+    errors = [{"loc": e.get("loc"), "msg": e.get("msg"), "type": e.get("type")} for e in exc.errors()]
+    logger.warning(
+        "Request validation failed",
+        extra={"path": request.url.path, "errors": errors, "sample": "validation_error"},
     )
+    return JSONResponse(status_code=422, content={"detail": errors})
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,11 +98,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON payloads (extracted text, question lists); brotli when available
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 app.include_router(upload.router, prefix="/api", tags=["Upload"])
 app.include_router(analyze.router, prefix="/api", tags=["Analyze"])
 app.include_router(generate.router, prefix="/api", tags=["Generate"])
 app.include_router(answers.router, prefix="/api", tags=["Answers"])
 app.include_router(pdf_export.router, prefix="/api", tags=["PDF Export"])
+app.include_router(corpus.router, prefix="/api", tags=["Corpus"])
+app.include_router(profiles.router, prefix="/api", tags=["Profiling"])
 
 
 @app.get("/")
@@ -60,3 +122,25 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        **metrics.snapshot(),
+        "routing": recent_decisions(),
+        "admission": pipeline_admission.stats(),
+        "speculative_admission": speculative_admission.stats(),
+    }
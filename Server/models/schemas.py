@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional, Dict, Any
 
 
@@ -6,10 +6,14 @@ class UploadResponse(BaseModel):
     session_id: str
     files_processed: int
     extracted_text: List[str]
+    credits_used: Optional[int] = None
     message: str
 
 
 class QuestionEntry(BaseModel):
+    # The model is free to write years as numbers
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
     question: str
     marks: int
     topic: str
@@ -18,14 +22,17 @@ class QuestionEntry(BaseModel):
 
 
 class TopicFrequency(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
     topic: str
     count: int
     years: List[str]
     percentage: float
 
 
-class AnalysisResult(BaseModel):
-    session_id: str
+class AnalysisPayload(BaseModel):
+    """Analysis fields as returned by the model (no session bookkeeping)."""
+    subject: Optional[str] = None
     total_questions: int
     topics: List[TopicFrequency]
     year_distribution: Dict[str, int]
@@ -34,6 +41,21 @@ class AnalysisResult(BaseModel):
     all_questions: List[QuestionEntry]
 
 
+class TopicForecast(BaseModel):
+    topic: str
+    score: float
+    appearances: int
+    last_seen: str
+    mean_gap: Optional[float] = None
+    overdue: bool
+    expected_mark_share: float
+
+
+class AnalysisResult(AnalysisPayload):
+    session_id: str
+    topic_forecast: List[TopicForecast] = []
+
+
 class GeneratedQuestion(BaseModel):
     number: int
     question: str
@@ -49,8 +71,8 @@ class GeneratedSection(BaseModel):
     total_marks: int
 
 
-class GeneratedPaper(BaseModel):
-    session_id: str
+class PaperPayload(BaseModel):
+    """Predicted paper fields as returned by the model."""
     title: str
     subject: str
     total_marks: int
@@ -59,6 +81,15 @@ class GeneratedPaper(BaseModel):
     sections: List[GeneratedSection]
 
 
+class GeneratedPaper(PaperPayload):
+    session_id: str
+
+
+class PaperVariants(BaseModel):
+    session_id: str
+    variants: List[GeneratedPaper]
+
+
 class AnsweredQuestion(BaseModel):
     number: int
     question: str
@@ -67,7 +98,41 @@ class AnsweredQuestion(BaseModel):
     answer: str
 
 
+class AnswerPayload(BaseModel):
+    """Answer fields as returned by the model."""
+    answered_questions: List[AnsweredQuestion]
+
+
 class AnswerSet(BaseModel):
     session_id: str
     title: str
     answered_questions: List[AnsweredQuestion]
+
+
+class CorpusQuestion(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    id: int
+    question: str
+    subject: Optional[str] = None
+    year: Optional[str] = None
+    topic: Optional[str] = None
+    section: Optional[str] = None
+    marks: Optional[int] = None
+
+
+class CorpusSearchResult(BaseModel):
+    items: List[CorpusQuestion]
+    next_cursor: Optional[int] = None
+
+
+class QuestionPage(BaseModel):
+    items: List[QuestionEntry]
+    next_cursor: Optional[int] = None
+    total: int
+
+
+class AnsweredQuestionPage(BaseModel):
+    items: List[AnsweredQuestion]
+    next_cursor: Optional[int] = None
+    total: int
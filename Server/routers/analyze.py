@@ -1,33 +1,152 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
 from pydantic import BaseModel
+from typing import Optional
+from functools import reduce
+import logging
+from services.executors import run_in
 from services.openai_service import analyze_questions
+from services.singleflight import pipeline_calls
+from services.admission import pipeline_admission
+from services.cancellation import guard_request
+from services.profiling import profile_request, span
+from services.analysis_merge import merge_analyses
+from services.speculative import SPECULATIVE_DEFAULT, start_speculation, cancel_speculation
+from services.question_corpus import (
+    content_hash,
+    batch_hash,
+    load_cached_analyses,
+    save_cached_analysis,
+    store_questions,
+)
+from models.schemas import AnalysisResult, QuestionPage
+from services.serialization import parse_fields, typed_response, paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from routers.upload import sessions, get_session
 from routers.auth import get_current_user
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 
 class AnalyzeRequest(BaseModel):
     session_id: str
+    # Pre-generate the paper, answers and PDFs in the background once analysis is done
+    speculative: Optional[bool] = None
+
+
+async def _analyze_texts(texts: list[str], api_key: str = None, user_id: int = None) -> dict:
+    """Analyze papers, reusing stored analyses of papers the corpus has already seen."""
+    hashes = [content_hash(t) for t in texts]
+    try:
+        cached = await run_in("db", load_cached_analyses, hashes)
+    except Exception as e:
+        logger.warning("Question corpus lookup failed: %s", e)
+        cached = {}
+
+    parts = [cached[h] for h in dict.fromkeys(hashes) if h in cached]
+    pending = [(t, h) for t, h in zip(texts, hashes) if h not in cached]
+    if pending:
+        pending_hashes = [h for _, h in pending]
+        key = pending_hashes[0] if len(pending) == 1 else batch_hash(pending_hashes)
+        analysis = None
+        if len(pending) > 1:
+            # Papers analyzed together are cached under their batch hash, not per paper
+            try:
+                analysis = (await run_in("db", load_cached_analyses, [key])).get(key)
+            except Exception as e:
+                logger.warning("Question corpus lookup failed: %s", e)
+        if analysis is None:
+            analysis = await analyze_questions([t for t, _ in pending], api_key=api_key, user_id=user_id)
+            try:
+                await run_in("db", save_cached_analysis, key, analysis)
+            except Exception as e:
+                logger.warning("Failed to cache analysis: %s", e)
+        parts.append(analysis)
+
+    # Cached analyses may have been produced for another user, so add them to this user's corpus too
+    try:
+        for part in parts:
+            await run_in("db", store_questions, part, user_id)
+    except Exception as e:
+        logger.warning("Failed to store analysis in question corpus: %s", e)
+
+    return reduce(merge_analyses, parts) if len(parts) > 1 else parts[0]
 
 
-@router.post("/analyze")
-async def analyze_papers(body: AnalyzeRequest, current_user: dict = Depends(get_current_user)):
-    """Analyze uploaded question papers for patterns and frequency."""
+@router.post("/analyze", response_model=AnalysisResult)
+async def analyze_papers(
+    request: Request,
+    body: AnalyzeRequest,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Analyze uploaded question papers for patterns and frequency.
+
+    `?fields=` limits the response to the listed top-level fields; page through
+    `all_questions` with GET /analysis/{session_id}/questions instead.
+    """
+    # Reject unknown fields before doing any work
+    parse_fields(fields, AnalysisResult)
     session = get_session(body.session_id)
     
     # Ensure current user owns this session
     if session.get("user_id") != current_user["id"]:
         raise HTTPException(status_code=403, detail="Unauthorized access to this session.")
     
-    try:
-        analysis = await analyze_questions(
-            session["extracted_texts"],
-            api_key=session.get("api_key"),
-            user_id=current_user["id"]
-        )
+    async def run_analysis():
+        # Anything pre-generated from the old analysis is about to be stale
+        cancel_speculation(session)
+        texts = list(session["extracted_texts"])
+        previous = session.get("analysis")
+        analyzed_count = session.get("analyzed_count", 0)
+
+        if previous and 0 < analyzed_count < len(texts):
+            # Papers appended to an analyzed session: only analyze the new ones
+            addition = await _analyze_texts(
+                texts[analyzed_count:],
+                api_key=session.get("api_key"),
+                user_id=current_user["id"]
+            )
+            analysis = merge_analyses(previous, addition)
+        else:
+            analysis = await _analyze_texts(
+                texts,
+                api_key=session.get("api_key"),
+                user_id=current_user["id"]
+            )
+        # Rank topics from the year data rather than trusting the model's guesses
+        from services.topic_forecast import apply_forecast
+        with span("forecast"):
+            apply_forecast(analysis)
         sessions[body.session_id]["analysis"] = analysis
+        sessions[body.session_id]["analyzed_count"] = len(texts)
         analysis["session_id"] = body.session_id
+        if body.speculative if body.speculative is not None else SPECULATIVE_DEFAULT:
+            start_speculation(session)
         return analysis
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+    async with profile_request(request, body.session_id, "analyze"), pipeline_admission.admit(current_user["id"]):
+        try:
+            # Double-clicks and duplicate tabs share one in-flight analysis
+            analysis = await guard_request(request, "analyze", pipeline_calls.do((body.session_id, "analyze"), run_analysis))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        return typed_response(AnalysisResult, analysis, fields)
+
+
+@router.get("/analysis/{session_id}/questions", response_model=QuestionPage)
+async def list_analyzed_questions(
+    session_id: str,
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """Page through the questions found by the last analysis."""
+    session = get_session(session_id)
+    if session.get("user_id") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Unauthorized access to this session.")
+    if not session.get("analysis"):
+        raise HTTPException(status_code=400, detail="Please analyze papers first.")
+    return typed_response(QuestionPage, paginate(session["analysis"].get("all_questions", []), cursor, limit))
@@ -1,6 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
 from pydantic import BaseModel
-from services.openai_service import generate_answers
+from typing import Optional
+from services.executors import run_in
+from services.openai_service import generate_answers, increment_user_credits
+from services.speculative import take_answers
+from services.singleflight import pipeline_calls
+from services.admission import pipeline_admission
+from services.cancellation import guard_request
+from services.profiling import profile_request
+from models.schemas import AnswerSet, AnsweredQuestionPage
+from services.serialization import parse_fields, typed_response, paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from routers.upload import sessions, get_session
 from routers.auth import get_current_user
 
@@ -11,9 +20,16 @@ class AnswersRequest(BaseModel):
     session_id: str
 
 
-@router.post("/answers")
-async def get_answers(body: AnswersRequest, current_user: dict = Depends(get_current_user)):
+@router.post("/answers", response_model=AnswerSet)
+async def get_answers(
+    request: Request,
+    body: AnswersRequest,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
     """Generate mark-appropriate answers for the generated question paper."""
+    # Reject unknown fields before doing any work
+    parse_fields(fields, AnswerSet)
     session = get_session(body.session_id)
     
     # Ensure current user owns this session
@@ -23,15 +39,44 @@ async def get_answers(body: AnswersRequest, current_user: dict = Depends(get_cur
     if not session.get("paper"):
         raise HTTPException(status_code=400, detail="Please generate a question paper first.")
     
-    try:
-        answer_set = await generate_answers(
-            session["paper"],
-            api_key=session.get("api_key"),
-            user_id=current_user["id"]
-        )
+    async def run_answers():
+        answer_set = await take_answers(session)
+        if answer_set is not None:
+            await run_in("db", increment_user_credits, current_user["id"])
+        else:
+            answer_set = await generate_answers(
+                session["paper"],
+                api_key=session.get("api_key"),
+                user_id=current_user["id"]
+            )
         sessions[body.session_id]["answers"] = answer_set
         answer_set["session_id"] = body.session_id
         answer_set["title"] = session["paper"].get("title", "Question Paper")
         return answer_set
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Answer generation failed: {str(e)}")
+
+    async with profile_request(request, body.session_id, "answers"), pipeline_admission.admit(current_user["id"]):
+        try:
+            answer_set = await guard_request(request, "answers", pipeline_calls.do((body.session_id, "answers"), run_answers))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Answer generation failed: {str(e)}")
+        return typed_response(AnswerSet, answer_set, fields)
+
+
+@router.get("/answers/{session_id}/questions", response_model=AnsweredQuestionPage)
+async def list_answered_questions(
+    session_id: str,
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """Page through the generated answers."""
+    session = get_session(session_id)
+    if session.get("user_id") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Unauthorized access to this session.")
+    if not session.get("answers"):
+        raise HTTPException(status_code=400, detail="No answers found. Please generate answers first.")
+    return typed_response(
+        AnsweredQuestionPage, paginate(session["answers"].get("answered_questions", []), cursor, limit)
+    )
@@ -5,9 +5,9 @@ from passlib.context import CryptContext
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import os
-import asyncio
 from pydantic import BaseModel, EmailStr
 from database import get_db_connection
+from services.executors import run_in
 
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
@@ -77,7 +77,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    user = await asyncio.to_thread(get_user_from_db, token_data.email)
+    user = await run_in("db", get_user_from_db, token_data.email)
     
     if user is None:
         raise credentials_exception
@@ -109,7 +109,7 @@ async def register(user_in: UserCreate):
         conn.close()
         return new_user
 
-    new_user = await asyncio.to_thread(register_user)
+    new_user = await run_in("db", register_user)
     if new_user is None:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -127,7 +127,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         conn.close()
         return user
 
-    user = await asyncio.to_thread(authenticate_user)
+    user = await run_in("db", authenticate_user)
     
     if not user or not verify_password(form_data.password, user[2]):
         raise HTTPException(
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
+from services.executors import run_in
+from models.schemas import CorpusSearchResult
+from services.question_corpus import search_questions
+from routers.auth import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/corpus/questions", response_model=CorpusSearchResult)
+async def search_corpus(
+    q: Optional[str] = None,
+    subject: Optional[str] = None,
+    year: Optional[str] = None,
+    topic: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """Search questions from the papers you have analyzed."""
+    try:
+        return await run_in(
+            "db", search_questions, current_user["id"], query=q, subject=subject, year=year, topic=topic, cursor=cursor, limit=limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Corpus search failed: {str(e)}")
@@ -1,19 +1,53 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from services.openai_service import generate_question_paper
+from fastapi import APIRouter, HTTPException, Depends, Request
+from pydantic import BaseModel, Field
+from typing import Optional
+import asyncio
+import logging
+import random
+from services.openai_service import generate_question_paper, increment_user_credits, analysis_context
+from services.speculative import take_paper, cancel_speculation
+from services.singleflight import pipeline_calls
+from services.admission import pipeline_admission
+from services.cancellation import guard_request
+from services.profiling import profile_request
+from services.executors import run_in
+from models.schemas import GeneratedPaper, PaperVariants
+from services.serialization import parse_fields, typed_response
 from routers.upload import sessions, get_session
 from routers.auth import get_current_user
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
+
+MAX_VARIANTS = 5
+# Number of topics each variant is asked to emphasise
+VARIANT_FOCUS_TOPICS = 4
+
 
 class GenerateRequest(BaseModel):
     session_id: str
 
 
-@router.post("/generate")
-async def generate_paper(body: GenerateRequest, current_user: dict = Depends(get_current_user)):
+class VariantsRequest(BaseModel):
+    session_id: str
+    count: int = Field(3, ge=2, le=MAX_VARIANTS)
+    # 0 = near-identical papers, 1 = widest temperature spread and topic rotation
+    diversity: float = Field(0.5, ge=0.0, le=1.0)
+    seed: Optional[int] = None
+
+
+@router.post("/generate", response_model=GeneratedPaper)
+async def generate_paper(
+    request: Request,
+    body: GenerateRequest,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
     """Generate a predicted question paper based on analysis."""
+    # Reject unknown fields before doing any work
+    parse_fields(fields, GeneratedPaper)
     session = get_session(body.session_id)
     
     # Ensure current user owns this session
@@ -23,14 +57,97 @@ async def generate_paper(body: GenerateRequest, current_user: dict = Depends(get
     if not session.get("analysis"):
         raise HTTPException(status_code=400, detail="Please analyze papers first before generating.")
     
-    try:
-        paper = await generate_question_paper(
-            session["analysis"],
-            api_key=session.get("api_key"),
-            user_id=current_user["id"]
-        )
+    async def run_generation():
+        paper = await take_paper(session)
+        if paper is not None:
+            # Speculative work is only charged once it is actually used
+            await run_in("db", increment_user_credits, current_user["id"])
+        else:
+            # Pre-generated answers would belong to a different paper
+            cancel_speculation(session, answers_only=True)
+            paper = await generate_question_paper(
+                session["analysis"],
+                api_key=session.get("api_key"),
+                user_id=current_user["id"]
+            )
         sessions[body.session_id]["paper"] = paper
         paper["session_id"] = body.session_id
         return paper
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Paper generation failed: {str(e)}")
+
+    async with profile_request(request, body.session_id, "generate"), pipeline_admission.admit(current_user["id"]):
+        try:
+            paper = await guard_request(request, "generate", pipeline_calls.do((body.session_id, "generate"), run_generation))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Paper generation failed: {str(e)}")
+        return typed_response(GeneratedPaper, paper, fields)
+
+
+def _variant_focus(analysis: dict, index: int, count: int) -> list[str]:
+    """Rotate through the ranked topics so each variant emphasises a different slice."""
+    ranked = [t["topic"] for t in analysis.get("topic_forecast", [])]
+    if not ranked:
+        by_count = sorted(analysis.get("topics", []), key=lambda t: t.get("count", 0), reverse=True)
+        ranked = list(dict.fromkeys(analysis.get("predicted_topics", []) + [t["topic"] for t in by_count]))
+    if not ranked:
+        return []
+    offset = (index * len(ranked)) // count
+    return (ranked[offset:] + ranked[:offset])[:VARIANT_FOCUS_TOPICS]
+
+
+@router.post("/generate/variants", response_model=PaperVariants)
+async def generate_variants(request: Request, body: VariantsRequest, current_user: dict = Depends(get_current_user)):
+    """Generate several distinct predicted papers concurrently from one analysis."""
+    session = get_session(body.session_id)
+
+    # Ensure current user owns this session
+    if session.get("user_id") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Unauthorized access to this session.")
+
+    if not session.get("analysis"):
+        raise HTTPException(status_code=400, detail="Please analyze papers first before generating.")
+
+    async def run_variants():
+        analysis = session["analysis"]
+        # Serialize once; every variant shares the same analysis prefix
+        context = analysis_context(analysis)
+        base_seed = body.seed if body.seed is not None else random.randrange(2 ** 31)
+
+        jobs = []
+        for i in range(body.count):
+            spread = i / (body.count - 1) - 0.5
+            jobs.append(generate_question_paper(
+                analysis,
+                api_key=session.get("api_key"),
+                user_id=current_user["id"],
+                temperature=round(0.7 + body.diversity * 0.5 * spread, 2),
+                seed=base_seed + i,
+                focus_topics=_variant_focus(analysis, i, body.count) if body.diversity > 0 else None,
+                context=context,
+            ))
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+
+        variants = []
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning("Variant %d of %d failed: %s", i + 1, body.count, result)
+                continue
+            result["session_id"] = body.session_id
+            variants.append(result)
+        if not variants:
+            raise ValueError("All variants failed")
+
+        sessions[body.session_id]["variants"] = variants
+        return {"session_id": body.session_id, "variants": variants}
+
+    async with profile_request(request, body.session_id, "variants"), pipeline_admission.admit(current_user["id"]):
+        try:
+            # Only identical requests share a run; different settings produce different papers
+            key = (body.session_id, "variants", body.count, body.diversity, body.seed)
+            result = await guard_request(request, "variants", pipeline_calls.do(key, run_variants))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Variant generation failed: {str(e)}")
+        return typed_response(PaperVariants, result)
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import Response
-from services.pdf_generator import create_question_paper_pdf, create_answer_pdf
+from services.speculative import cached_pdf
+from services.cancellation import guard_request
+from services.executors import run_in
 from routers.upload import sessions, get_session
 from routers.auth import get_current_user
 
@@ -8,7 +10,7 @@ router = APIRouter()
 
 
 @router.get("/pdf/questions/{session_id}")
-async def download_question_paper(session_id: str, current_user: dict = Depends(get_current_user)):
+async def download_question_paper(request: Request, session_id: str, current_user: dict = Depends(get_current_user)):
     """Download the generated question paper as PDF."""
     session = get_session(session_id)
     
@@ -20,19 +22,27 @@ async def download_question_paper(session_id: str, current_user: dict = Depends(
         raise HTTPException(status_code=400, detail="No generated paper found. Please generate a paper first.")
     
     try:
-        pdf_bytes = create_question_paper_pdf(session["paper"])
+        pdf_bytes = cached_pdf(session, "questions", session["paper"])
+        if pdf_bytes is None:
+            # ReportLab is only loaded once a PDF is actually requested
+            from services.pdf_generator import create_question_paper_pdf
+            pdf_bytes = await guard_request(
+                request, "pdf", run_in("pdf", create_question_paper_pdf, session["paper"])
+            )
         filename = session["paper"].get("title", "Question_Paper").replace(" ", "_").replace("/", "-")
         return Response(
             content=pdf_bytes,
             media_type="application/pdf",
             headers={"Content-Disposition": f'attachment; filename="{filename}.pdf"'},
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
 
 
 @router.get("/pdf/answers/{session_id}")
-async def download_answer_pdf(session_id: str, current_user: dict = Depends(get_current_user)):
+async def download_answer_pdf(request: Request, session_id: str, current_user: dict = Depends(get_current_user)):
     """Download the question paper with answers as PDF."""
     session = get_session(session_id)
     
@@ -45,12 +55,48 @@ async def download_answer_pdf(session_id: str, current_user: dict = Depends(get_
     
     try:
         title = session.get("paper", {}).get("title", "Question Paper")
-        pdf_bytes = create_answer_pdf(session["answers"], paper_title=title)
+        pdf_bytes = cached_pdf(session, "answers", session["answers"])
+        if pdf_bytes is None:
+            from services.pdf_generator import create_answer_pdf
+            pdf_bytes = await guard_request(
+                request, "pdf", run_in("pdf", create_answer_pdf, session["answers"], paper_title=title)
+            )
         filename = f"{title.replace(' ', '_').replace('/', '-')}_Answers"
         return Response(
             content=pdf_bytes,
             media_type="application/pdf",
             headers={"Content-Disposition": f'attachment; filename="{filename}.pdf"'},
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
+
+
+@router.get("/pdf/variants/{session_id}/{index}")
+async def download_variant_paper(request: Request, session_id: str, index: int, current_user: dict = Depends(get_current_user)):
+    """Download one of the generated paper variants as PDF (index starts at 1)."""
+    session = get_session(session_id)
+
+    # Ensure current user owns this session
+    if session.get("user_id") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Unauthorized access to this session.")
+
+    variants = session.get("variants") or []
+    if not 1 <= index <= len(variants):
+        raise HTTPException(status_code=404, detail="Variant not found. Please generate variants first.")
+
+    try:
+        from services.pdf_generator import create_question_paper_pdf
+        paper = variants[index - 1]
+        pdf_bytes = await guard_request(request, "pdf", run_in("pdf", create_question_paper_pdf, paper))
+        filename = f"{paper.get('title', 'Question_Paper').replace(' ', '_').replace('/', '-')}_Variant_{index}"
+        return Response(
+            content=pdf_bytes,
+            media_type="application/pdf",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.pdf"'},
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
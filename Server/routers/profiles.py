@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from services.profiling import PROFILE_TOKEN, has_profile_token, session_profiles
+from routers.upload import get_session
+from routers.auth import get_current_user
+
+router = APIRouter()
+
+
+def _profiles_for(request: Request, session_id: str, current_user: dict) -> list:
+    session = get_session(session_id)
+    if session.get("user_id") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Unauthorized access to this session.")
+    # Stacks show server internals; when a profile token is configured, require it
+    if PROFILE_TOKEN and not has_profile_token(request):
+        raise HTTPException(status_code=403, detail="A valid X-Profile-Token header is required.")
+    profiles = session_profiles(session_id)
+    if not profiles:
+        raise HTTPException(status_code=404, detail="No profiles recorded for this session.")
+    return profiles
+
+
+@router.get("/profiles/{session_id}")
+async def list_profiles(request: Request, session_id: str, current_user: dict = Depends(get_current_user)):
+    """Per-stage wall and CPU timings of the profiled requests of a session."""
+    return [p.summary() for p in _profiles_for(request, session_id, current_user)]
+
+
+@router.get("/profiles/{session_id}/flamegraph", response_class=PlainTextResponse)
+async def download_flamegraph(
+    request: Request,
+    session_id: str,
+    stage: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Sampled stacks in collapsed format, for flamegraph.pl, speedscope or inferno.
+
+    Pass `stage` (upload, analyze, generate, variants, answers) to limit it to one step.
+    """
+    profiles = [
+        p for p in _profiles_for(request, session_id, current_user)
+        if stage is None or p.stage == stage
+    ]
+    if not profiles:
+        raise HTTPException(status_code=404, detail=f"No profile recorded for stage '{stage}'.")
+    return PlainTextResponse(
+        "".join(p.collapsed() for p in profiles),
+        headers={"Content-Disposition": f'attachment; filename="profile_{session_id}.folded"'},
+    )
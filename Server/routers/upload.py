@@ -1,64 +1,113 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header, Depends, Request
 from typing import List, Optional
+import logging
 import uuid
+from models.schemas import UploadResponse
 from services.pdf_parser import process_file
+from services.admission import pipeline_admission
+from services.cancellation import guard_request
+from services.profiling import profile_request
+from services.logging_setup import bind_session_id
+from services.serialization import parse_fields, typed_response
+from services.speculative import cancel_speculation
 from routers.auth import get_current_user
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 # In-memory session store (production would use Redis/DB)
 sessions: dict = {}
 
 
-@router.post("/upload")
+@router.post("/upload", response_model=UploadResponse)
 async def upload_files(
+    request: Request,
     files: List[UploadFile] = File(...),
     api_key: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Upload 1-10 question paper files (PDF or image)."""
+    """Upload 1-10 question paper files (PDF or image).
+
+    Pass an existing `session_id` to append the files to that session; only the
+    new files are extracted, and the next analysis only processes them.
+    Use `?fields=session_id,files_processed,message` to skip echoing the text back.
+    """
+    # Reject unknown fields before doing any work
+    parse_fields(fields, UploadResponse)
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
     if len(files) > 10:
         raise HTTPException(status_code=400, detail="Maximum 10 files allowed")
 
-    session_id = str(uuid.uuid4())
+    existing = None
+    if session_id:
+        existing = get_session(session_id)
+        if existing.get("user_id") != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Unauthorized access to this session.")
+    else:
+        session_id = str(uuid.uuid4())
+        bind_session_id(session_id)
     extracted_texts = []
     errors = []
 
-    for file in files:
-        try:
-            content = await file.read()
-            text = await process_file(file.filename, content, api_key=api_key, user_id=current_user["id"])
-            extracted_texts.append(f"[FILE: {file.filename}]\n{text}")
-        except Exception as e:
-            import traceback
-            print(f"ERROR processing {file.filename}: {e}")
-            traceback.print_exc()
-            errors.append(f"{file.filename}: {str(e)}")
+    async def extract_all():
+        for file in files:
+            try:
+                content = await file.read()
+                text = await process_file(file.filename, content, api_key=api_key, user_id=current_user["id"])
+                extracted_texts.append(f"[FILE: {file.filename}]\n{text}")
+            except Exception as e:
+                logger.exception(
+                    "Failed to process %s", file.filename, extra={"sample": "upload_file_failed"}
+                )
+                errors.append(f"{file.filename}: {str(e)}")
+
+    async with profile_request(request, session_id, "upload"), pipeline_admission.admit(current_user["id"]):
+        # Stop OCR (and its credits) if the user leaves or the upload runs too long
+        await guard_request(request, "upload", extract_all())
 
     if not extracted_texts:
         raise HTTPException(status_code=422, detail=f"Could not extract text from any file. Errors: {errors}")
 
-    sessions[session_id] = {
-        "extracted_texts": extracted_texts,
-        "api_key": api_key,
-        "analysis": None,
-        "paper": None,
-        "answers": None,
-        "user_id": current_user["id"]
-    }
+    if existing is not None:
+        cancel_speculation(existing)
+        existing["extracted_texts"].extend(extracted_texts)
+        if api_key:
+            existing["api_key"] = api_key
+    else:
+        sessions[session_id] = {
+            "extracted_texts": extracted_texts,
+            "api_key": api_key,
+            "analysis": None,
+            # Number of extracted_texts already covered by "analysis"
+            "analyzed_count": 0,
+            "paper": None,
+            "answers": None,
+            "user_id": current_user["id"]
+        }
 
-    return {
+    return typed_response(UploadResponse, {
         "session_id": session_id,
         "files_processed": len(extracted_texts),
         "extracted_text": extracted_texts,
         "credits_used": current_user["credits_used"] + len(extracted_texts), # Rough estimate for UI
         "message": f"Successfully processed {len(extracted_texts)} file(s). {f'Errors: {errors}' if errors else ''}",
-    }
+    }, fields)
 
 
 def get_session(session_id: str) -> dict:
     if session_id not in sessions:
         raise HTTPException(status_code=404, detail="Session not found. Please upload files again.")
+    # Every endpoint looks its session up here, so this tags the request's log records
+    bind_session_id(session_id)
     return sessions[session_id]
+
+
+@router.get("/ocr/dedup-report")
+async def ocr_dedup_report(current_user: dict = Depends(get_current_user)):
+    """How many of your OCR calls were skipped because you uploaded a near-identical page before."""
+    from services.page_hash import page_index
+    return page_index.report(current_user["id"])
@@ -0,0 +1,109 @@
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from services import metrics
+from services.profiling import record_wait
+
+GLOBAL_LIMIT = int(os.getenv("ADMISSION_GLOBAL_LIMIT", "16"))
+PER_USER_LIMIT = int(os.getenv("ADMISSION_PER_USER_LIMIT", "3"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+# Concurrent speculative pre-generation chains (one per user, never queued)
+SPECULATIVE_LIMIT = int(os.getenv("ADMISSION_SPECULATIVE_LIMIT", "4"))
+# Starting guess for how long an admitted pipeline request runs, in seconds
+DEFAULT_DURATION = 30.0
+EWMA_ALPHA = 0.2
+
+
+class AdmissionController:
+    """Concurrency limits for expensive pipeline requests.
+
+    At most `global_limit` requests run at once and each user may hold
+    `per_user_limit` of them (running or queued). When the wait queue is full
+    the request is rejected with 429 and a Retry-After based on recent run times.
+    """
+
+    def __init__(
+        self,
+        global_limit: int = GLOBAL_LIMIT,
+        per_user_limit: int = PER_USER_LIMIT,
+        max_queue: int = MAX_QUEUE,
+        name: str = "pipeline",
+    ):
+        self.name = name
+        self.global_limit = global_limit
+        self.per_user_limit = per_user_limit
+        self.max_queue = max_queue
+        self._semaphore: asyncio.Semaphore | None = None
+        self._per_user: dict = defaultdict(int)
+        self._running = 0
+        self._waiting = 0
+        self._avg_duration = DEFAULT_DURATION
+
+    def _reject(self, reason: str, retry_after: float):
+        metrics.incr("admission_rejected", reason=reason, pool=self.name)
+        raise HTTPException(
+            status_code=429,
+            detail="Server is busy, please retry shortly." if reason == "queue_full"
+            else "Too many requests in progress for this account.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def _retry_after(self) -> float:
+        return self._avg_duration * (self._waiting + 1) / self.global_limit
+
+    @asynccontextmanager
+    async def admit(self, user_id):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.global_limit)
+
+        if self._per_user[user_id] >= self.per_user_limit:
+            self._reject("per_user", self._avg_duration)
+        if self._running >= self.global_limit and self._waiting >= self.max_queue:
+            self._reject("queue_full", self._retry_after())
+
+        self._per_user[user_id] += 1
+        try:
+            self._waiting += 1
+            queued_at = time.monotonic()
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self._waiting -= 1
+            waited = time.monotonic() - queued_at
+            metrics.observe("admission_wait_seconds", waited, pool=self.name)
+            record_wait("admission_wait", waited)
+
+            self._running += 1
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self._running -= 1
+                self._semaphore.release()
+                duration = time.monotonic() - started
+                self._avg_duration = EWMA_ALPHA * duration + (1 - EWMA_ALPHA) * self._avg_duration
+        finally:
+            self._per_user[user_id] -= 1
+            if not self._per_user[user_id]:
+                del self._per_user[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "global_limit": self.global_limit,
+            "per_user_limit": self.per_user_limit,
+            "max_queue": self.max_queue,
+        }
+
+
+pipeline_admission = AdmissionController()
+# Background work nobody is waiting for yet; kept apart so it never takes a
+# slot from (or queues ahead of) a user's own request
+speculative_admission = AdmissionController(
+    global_limit=SPECULATIVE_LIMIT, per_user_limit=1, max_queue=0, name="speculative"
+)
@@ -0,0 +1,59 @@
+def _topic_key(name: str) -> str:
+    return " ".join((name or "").split()).casefold()
+
+
+def _union(first: list, second: list) -> list:
+    seen = set()
+    merged = []
+    for item in list(first or []) + list(second or []):
+        key = _topic_key(item) if isinstance(item, str) else item
+        if key not in seen:
+            seen.add(key)
+            merged.append(item)
+    return merged
+
+
+def merge_analyses(base: dict, extra: dict) -> dict:
+    """Merge the analysis of additional papers into an existing analysis.
+
+    Question lists and year counts are added, topic statistics are combined by
+    topic name and their percentages recomputed against the new total.
+    """
+    merged = dict(base)
+    all_questions = list(base.get("all_questions", [])) + list(extra.get("all_questions", []))
+    total = (base.get("total_questions") or 0) + (extra.get("total_questions") or 0)
+    total = max(total, len(all_questions))
+
+    year_distribution = dict(base.get("year_distribution", {}))
+    for year, count in extra.get("year_distribution", {}).items():
+        year_distribution[year] = year_distribution.get(year, 0) + count
+
+    topics: dict = {}
+    for topic in list(base.get("topics", [])) + list(extra.get("topics", [])):
+        key = _topic_key(topic.get("topic"))
+        current = topics.get(key)
+        if current is None:
+            topics[key] = {
+                "topic": topic.get("topic"),
+                "count": topic.get("count", 0),
+                "years": list(topic.get("years", [])),
+            }
+        else:
+            current["count"] += topic.get("count", 0)
+            current["years"] = _union(current["years"], topic.get("years", []))
+
+    merged_topics = sorted(topics.values(), key=lambda t: t["count"], reverse=True)
+    for topic in merged_topics:
+        topic["years"] = sorted(topic["years"])
+        topic["percentage"] = round(100.0 * topic["count"] / total, 1) if total else 0.0
+
+    merged.update({
+        "subject": base.get("subject") or extra.get("subject"),
+        "total_questions": total,
+        "topics": merged_topics,
+        "year_distribution": year_distribution,
+        "predicted_topics": _union(extra.get("predicted_topics", []), base.get("predicted_topics", [])),
+        "pattern_insights": _union(base.get("pattern_insights", []), extra.get("pattern_insights", [])),
+        "all_questions": all_questions,
+    })
+    return merged
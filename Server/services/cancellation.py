@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import os
+import threading
+from fastapi import HTTPException, Request
+from services import metrics
+
+# Wall-clock budget per pipeline request, in seconds
+STAGE_DEADLINES = {
+    "upload": float(os.getenv("DEADLINE_UPLOAD_SECONDS", "300")),
+    "analyze": float(os.getenv("DEADLINE_ANALYZE_SECONDS", "600")),
+    "generate": float(os.getenv("DEADLINE_GENERATE_SECONDS", "300")),
+    "variants": float(os.getenv("DEADLINE_VARIANTS_SECONDS", "420")),
+    "answers": float(os.getenv("DEADLINE_ANSWERS_SECONDS", "420")),
+    "pdf": float(os.getenv("DEADLINE_PDF_SECONDS", "60")),
+}
+# How often to check whether the client is still connected
+DISCONNECT_POLL_SECONDS = 1.0
+
+
+class OperationCancelled(Exception):
+    """Raised inside a worker thread whose caller has been cancelled."""
+
+
+class CancelToken:
+    """Thread-safe cancellation flag for blocking work running in a thread pool.
+
+    Workers either poll it with `raise_if_cancelled()` or register a callback
+    (such as closing an HTTP stream) that interrupts a blocking read.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+_current_token: contextvars.ContextVar[CancelToken | None] = contextvars.ContextVar("cancel_token", default=None)
+
+
+def bind_token(token: CancelToken):
+    _current_token.set(token)
+
+
+def raise_if_cancelled():
+    """Abort the current worker-thread job if the coroutine waiting for it was cancelled."""
+    token = _current_token.get()
+    if token is not None and token.cancelled:
+        raise OperationCancelled()
+
+
+def on_cancel(callback):
+    """Run `callback` (from another thread) if the current job gets cancelled."""
+    token = _current_token.get()
+    if token is not None:
+        token.on_cancel(callback)
+
+
+async def _wait_for_disconnect(request: Request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def _cancel(task: asyncio.Future):
+    task.cancel()
+    # Let the work unwind (and its worker threads be signalled) before responding
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def guard_request(request: Request, stage: str, work):
+    """Await `work` unless the client disconnects or the stage deadline passes first.
+
+    Either way the work is cancelled, which propagates to any LLM, OCR or render
+    job it is waiting on; credits are only charged for work that completes.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {task, watcher}, timeout=STAGE_DEADLINES[stage], return_when=asyncio.FIRST_COMPLETED
+        )
+    except asyncio.CancelledError:
+        await _cancel(task)
+        raise
+    finally:
+        watcher.cancel()
+
+    if task in done:
+        return task.result()
+
+    await _cancel(task)
+    if watcher in done:
+        metrics.incr("requests_cancelled", stage=stage, reason="disconnect")
+        # Nobody is listening; the status only shows up in access logs
+        raise HTTPException(status_code=499, detail="Client closed the request.")
+    metrics.incr("requests_cancelled", stage=stage, reason="deadline")
+    raise HTTPException(
+        status_code=504,
+        detail=f"The {stage} step did not finish within {STAGE_DEADLINES[stage]:.0f} seconds.",
+    )
@@ -0,0 +1,82 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from services import metrics
+from services.cancellation import CancelToken, bind_token
+from services.profiling import traced
+
+# Separate bounded pools per workload class, so slow LLM completions can't
+# starve logins and credit updates the way a shared default pool does.
+WORKLOAD_THREADS = {
+    "llm": int(os.getenv("EXECUTOR_LLM_THREADS", "32")),
+    "ocr": int(os.getenv("EXECUTOR_OCR_THREADS", "8")),
+    "db": int(os.getenv("EXECUTOR_DB_THREADS", "8")),
+    "pdf": int(os.getenv("EXECUTOR_PDF_THREADS", "4")),
+}
+# Worker processes for CPU-bound parsing of large documents
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_process_pool: ProcessPoolExecutor | None = None
+_lock = threading.Lock()
+
+
+def get_executor(workload: str) -> ThreadPoolExecutor:
+    executor = _executors.get(workload)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(workload)
+            if executor is None:
+                executor = _executors[workload] = ThreadPoolExecutor(
+                    max_workers=WORKLOAD_THREADS[workload],
+                    thread_name_prefix=f"{workload}-worker",
+                )
+    return executor
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        with _lock:
+            if _process_pool is None:
+                # Forking a process that runs threads (event loop, pools, log writer)
+                # can copy held locks into the child, so start clean interpreters
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _process_pool
+
+
+async def run_in(workload: str, fn, *args, **kwargs):
+    """Run a blocking call on the workload's own thread pool.
+
+    Like asyncio.to_thread, the caller's context variables are carried over.
+    If the caller is cancelled the job's CancelToken is cancelled too, so work
+    that checks it (see services.cancellation) stops instead of running on.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    token = CancelToken()
+    context.run(bind_token, token)
+    try:
+        return await loop.run_in_executor(
+            get_executor(workload),
+            functools.partial(context.run, traced(workload, fn), *args, **kwargs),
+        )
+    except asyncio.CancelledError:
+        token.cancel()
+        metrics.incr("jobs_cancelled", workload=workload)
+        raise
+
+
+def shutdown():
+    global _process_pool
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
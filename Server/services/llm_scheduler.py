@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import os
+import random
+import re
+import time
+from services import metrics
+from services.executors import run_in
+from services.profiling import record_wait
+
+# Priority classes: lower value is dispatched first when a key is saturated
+PRIORITY_OCR = 0
+PRIORITY_ANALYSIS = 1
+PRIORITY_GENERATION = 2
+PRIORITY_ANSWERS = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_OCR: "ocr",
+    PRIORITY_ANALYSIS: "analysis",
+    PRIORITY_GENERATION: "generation",
+    PRIORITY_ANSWERS: "answers",
+}
+
+DEFAULT_RPM = int(os.getenv("OPENAI_RPM", "500"))
+DEFAULT_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+_DURATION_PART = re.compile(r"([\d.]+)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value: str) -> float | None:
+    """Parse OpenAI reset headers such as '1s', '6m0s' or '20ms' into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def retry_delay_from_headers(headers) -> float | None:
+    """Server-suggested wait before retrying, if the response carries one."""
+    if headers is None:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    resets = [
+        parse_reset_duration(headers.get("x-ratelimit-reset-requests")),
+        parse_reset_duration(headers.get("x-ratelimit-reset-tokens")),
+    ]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+def estimate_tokens(messages: list, max_tokens: int = 0) -> int:
+    """Rough token cost of a chat call (~4 characters per token plus the output budget)."""
+    chars = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                else:
+                    # Images are billed by tile, not by base64 length
+                    chars += 4 * 1000
+    return chars // 4 + (max_tokens or 0)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def sync(self, limit: str = None, remaining: str = None):
+        """Align the bucket with the limits the API reports in its response headers."""
+        try:
+            if limit:
+                per_minute = float(limit)
+                self.capacity = per_minute
+                self.rate = per_minute / 60.0
+            if remaining:
+                self._refill()
+                self.tokens = min(self.tokens, float(remaining))
+        except ValueError:
+            pass
+
+
+class _KeyState:
+    """Buckets and priority wait queue for one API key."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.waiters: list = []
+        self.cond = asyncio.Condition()
+
+    def delay(self, tokens: int) -> float:
+        pause = max(0.0, self.paused_until - time.monotonic())
+        return max(pause, self.requests.delay(1), self.tokens.delay(tokens))
+
+
+class LLMScheduler:
+    """Central gate for outbound LLM calls.
+
+    Each API key gets request-per-minute and token-per-minute buckets and a
+    priority queue, so concurrent users share the provider's limits instead of
+    each hitting 429s and backing off on their own. Retries use jittered
+    exponential backoff, stretched to whatever the rate-limit headers ask for,
+    and a 429 pauses every caller on that key.
+    """
+
+    def __init__(self, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM, max_retries: int = MAX_RETRIES):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self._states: dict[str, _KeyState] = {}
+        self._seq = itertools.count()
+
+    @staticmethod
+    def key_id(api_key: str = None) -> str:
+        # Never keep raw keys around as dict keys or metric labels
+        if not api_key:
+            return "default"
+        return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+    def _state(self, key: str) -> _KeyState:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _KeyState(self.rpm, self.tpm)
+        return state
+
+    async def _acquire(self, state: _KeyState, priority: int, tokens: int):
+        entry = (priority, next(self._seq))
+        async with state.cond:
+            heapq.heappush(state.waiters, entry)
+            try:
+                while True:
+                    timeout = None
+                    if state.waiters[0] == entry:
+                        timeout = state.delay(tokens)
+                        if timeout <= 0:
+                            heapq.heappop(state.waiters)
+                            state.requests.take(1)
+                            state.tokens.take(tokens)
+                            state.cond.notify_all()
+                            return
+                    try:
+                        await asyncio.wait_for(state.cond.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in state.waiters:
+                    state.waiters.remove(entry)
+                    heapq.heapify(state.waiters)
+                    state.cond.notify_all()
+                raise
+
+    async def _pause(self, state: _KeyState, seconds: float):
+        async with state.cond:
+            state.paused_until = max(state.paused_until, time.monotonic() + seconds)
+            state.cond.notify_all()
+
+    def _backoff(self, attempt: int, hint: float = None) -> float:
+        if hint is not None:
+            # Respect the server's hint, with a little jitter so callers don't retry in lockstep
+            return hint + random.uniform(0, BACKOFF_BASE)
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    async def submit(self, api_key: str, priority: int, estimated_tokens: int, call, on_complete=None):
+        """Run `call` (a sync function returning an OpenAI raw response) under the key's limits.
+
+        Cancelling the awaiting task cancels the call's CancelToken, so a streaming
+        call stops mid-response.
+
+        Returns the parsed response object. `on_complete(seconds, parsed)` is called
+        with the duration of the successful attempt, excluding queueing and retries.
+        """
+        from openai import APIConnectionError, APITimeoutError, APIStatusError, RateLimitError
+
+        key = self.key_id(api_key)
+        state = self._state(key)
+        label = PRIORITY_NAMES.get(priority, str(priority))
+        # Vision OCR calls get their own threads so a burst of uploads can't block analyses
+        workload = "ocr" if priority == PRIORITY_OCR else "llm"
+
+        for attempt in range(self.max_retries + 1):
+            queued_at = time.monotonic()
+            await self._acquire(state, priority, estimated_tokens)
+            waited = time.monotonic() - queued_at
+            metrics.observe("llm_queue_wait_seconds", waited, priority=label)
+            record_wait(f"{workload}:queue_wait", waited)
+
+            started = time.monotonic()
+            try:
+                raw = await run_in(workload, call)
+            except asyncio.CancelledError:
+                metrics.incr("llm_calls_cancelled", priority=label)
+                raise
+            except (RateLimitError, APIStatusError, APIConnectionError, APITimeoutError) as e:
+                status = getattr(e, "status_code", None)
+                retryable = isinstance(e, (RateLimitError, APIConnectionError, APITimeoutError)) or (
+                    status is not None and status >= 500
+                )
+                if not retryable or attempt == self.max_retries:
+                    metrics.incr("llm_calls_failed", priority=label)
+                    raise
+                response = getattr(e, "response", None)
+                delay = self._backoff(attempt, retry_delay_from_headers(getattr(response, "headers", None)))
+                metrics.incr("llm_retries", priority=label, status=status or "connection")
+                if isinstance(e, RateLimitError):
+                    await self._pause(state, delay)
+                else:
+                    await asyncio.sleep(delay)
+                continue
+
+            elapsed = time.monotonic() - started
+            metrics.observe("llm_call_seconds", elapsed, priority=label)
+            headers = raw.headers
+            state.requests.sync(headers.get("x-ratelimit-limit-requests"), headers.get("x-ratelimit-remaining-requests"))
+            state.tokens.sync(headers.get("x-ratelimit-limit-tokens"), headers.get("x-ratelimit-remaining-tokens"))
+
+            parsed = raw.parse()
+            usage = getattr(parsed, "usage", None)
+            if usage is not None and usage.total_tokens < estimated_tokens:
+                state.tokens.give_back(estimated_tokens - usage.total_tokens)
+            if on_complete is not None:
+                on_complete(elapsed, parsed)
+            return parsed
+
+
+scheduler = LLMScheduler()
@@ -0,0 +1,180 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from services import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Records waiting for the writer thread; beyond this new records are dropped, not blocked on
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Longest message, field value or traceback kept in a record
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+# Sampled events: the first LOG_SAMPLE_BURST per window are logged, then one in LOG_SAMPLE_EVERY
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+LOG_SAMPLE_WINDOW = 60.0
+
+_SECRETS = [
+    (re.compile(r"sk-[A-Za-z0-9_\-]{8,}"), "sk-***"),
+    (re.compile(r"(?i)bearer\s+[A-Za-z0-9_\-.=]+"), "Bearer ***"),
+    (re.compile(r"eyJ[A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]+"), "***jwt***"),
+]
+_SECRET_FIELDS = {"api_key", "password", "token", "authorization", "access_token"}
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_session_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("log_session_id", default=None)
+
+
+def bind_session_id(session_id: str):
+    """Tag every record logged from the current request (and its worker jobs) with `session_id`."""
+    _session_id.set(session_id)
+
+
+def scrub(value, limit: int = LOG_MAX_FIELD_CHARS) -> str:
+    """Redact API keys and tokens, then truncate."""
+    text = value if isinstance(value, str) else str(value)
+    if len(text) > limit * 2:
+        # Don't run the patterns over a multi-megabyte value
+        text = text[:limit * 2]
+    for pattern, replacement in _SECRETS:
+        text = pattern.sub(replacement, text)
+    if len(text) > limit:
+        text = f"{text[:limit]}... [truncated]"
+    return text
+
+
+class _Sampler(logging.Filter):
+    """Rate-limits records logged with extra={"sample": "<event>"}.
+
+    Each event may burst, after which only every Nth record passes; the next
+    record that passes carries how many were suppressed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._events: dict = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "sample", None)
+        if event is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            state = self._events.get(event)
+            if state is None or now - state["start"] > LOG_SAMPLE_WINDOW:
+                state = self._events[event] = {"start": now, "seen": 0, "suppressed": 0}
+            state["seen"] += 1
+            if state["seen"] > LOG_SAMPLE_BURST and state["seen"] % LOG_SAMPLE_EVERY:
+                state["suppressed"] += 1
+                metrics.incr("log_records_sampled_out", event=event)
+                return False
+            if state["suppressed"]:
+                record.suppressed = state["suppressed"]
+                state["suppressed"] = 0
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; drops them if the queue is full.
+
+    Messages are rendered, redacted and truncated here so the queued record
+    holds no references to large arguments or tracebacks.
+    """
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("log_records_dropped")
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = scrub(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            record.exc_text = scrub(logging.Formatter().formatException(record.exc_info), LOG_MAX_FIELD_CHARS * 4)
+        record.exc_info = None
+        record.stack_info = None
+        record.session_id = _session_id.get()
+        for key, value in list(vars(record).items()):
+            if key in _RESERVED:
+                continue
+            if key in _SECRET_FIELDS:
+                setattr(record, key, "***")
+            elif not isinstance(value, (int, float, bool, type(None))):
+                setattr(record, key, scrub(value) if not isinstance(value, (dict, list)) else _scrub_nested(value))
+        return record
+
+
+def _scrub_nested(value, depth: int = 0):
+    if depth > 3:
+        return scrub(value)
+    if isinstance(value, dict):
+        return {
+            k: "***" if k in _SECRET_FIELDS else _scrub_nested(v, depth + 1)
+            for k, v in list(value.items())[:50]
+        }
+    if isinstance(value, (list, tuple)):
+        return [_scrub_nested(v, depth + 1) for v in value[:50]]
+    if isinstance(value, (int, float, bool, type(None))):
+        return value
+    return scrub(value)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, session_id and any extra fields."""
+
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key != "sample" and value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_listener: QueueListener | None = None
+
+
+def configure_logging():
+    """Route all logging through a bounded queue to a JSON writer thread. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter())
+    _listener = QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+    handler = _NonBlockingQueueHandler(log_queue)
+    handler.addFilter(_Sampler())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
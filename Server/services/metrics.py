@@ -0,0 +1,44 @@
+import threading
+from collections import defaultdict
+
+# Minimal in-process metrics registry, exposed as JSON on /metrics.
+# Counters and timing summaries are keyed by name plus sorted labels.
+
+_lock = threading.Lock()
+_counters: dict = defaultdict(float)
+_timings: dict = {}
+
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+def incr(name: str, value: float = 1, **labels):
+    """Increment a counter."""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name: str, seconds: float, **labels):
+    """Record a duration (or any other sample) in a count/sum/max summary."""
+    key = _key(name, labels)
+    with _lock:
+        summary = _timings.get(key)
+        if summary is None:
+            summary = _timings[key] = {"count": 0, "sum": 0.0, "max": 0.0}
+        summary["count"] += 1
+        summary["sum"] += seconds
+        summary["max"] = max(summary["max"], seconds)
+
+
+def snapshot() -> dict:
+    """Return a copy of all metrics, with averages filled in for summaries."""
+    with _lock:
+        timings = {
+            key: {**summary, "avg": summary["sum"] / summary["count"] if summary["count"] else 0.0}
+            for key, summary in _timings.items()
+        }
+        return {"counters": dict(_counters), "timings": timings}
@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict
+from services import metrics
+
+FAST_MODEL = os.getenv("LLM_FAST_MODEL", "gpt-4o-mini")
+LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "gpt-4o")
+# Output ceiling of the models above
+MAX_OUTPUT_TOKENS = 16000
+# Analysis prompts above this many tokens are split into chunks and merged
+ANALYSIS_CHUNK_TOKENS = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "30000"))
+
+# Per-stage latency targets (seconds) and sizing rules.
+# `large_above` is the prompt size at which the higher-capacity model is used.
+STAGES = {
+    "ocr": {
+        "slo": float(os.getenv("SLO_OCR_SECONDS", "30")),
+        "min_output": 1500,
+        "max_output": 3000,
+        "large_above": None,
+    },
+    "analysis": {
+        "slo": float(os.getenv("SLO_ANALYSIS_SECONDS", "120")),
+        "min_output": 2000,
+        "max_output": MAX_OUTPUT_TOKENS,
+        "large_above": None,  # big analyses are chunked instead
+    },
+    "generation": {
+        "slo": float(os.getenv("SLO_GENERATION_SECONDS", "90")),
+        "min_output": 3000,
+        "max_output": 6000,
+        "large_above": int(os.getenv("GENERATION_LARGE_ABOVE_TOKENS", "20000")),
+    },
+    "answers": {
+        "slo": float(os.getenv("SLO_ANSWERS_SECONDS", "150")),
+        "min_output": 2000,
+        "max_output": MAX_OUTPUT_TOKENS,
+        "large_above": int(os.getenv("ANSWERS_LARGE_ABOVE_TOKENS", "12000")),
+    },
+}
+
+# Fallback throughput before any calls have been observed (output tokens per second)
+DEFAULT_TOKENS_PER_SECOND = 50.0
+REQUEST_OVERHEAD_SECONDS = 5.0
+MAX_TIMEOUT_SECONDS = 300.0
+EWMA_ALPHA = 0.2
+
+
+@dataclass
+class Route:
+    stage: str
+    model: str
+    max_tokens: int
+    timeout: float
+    prompt_tokens: int
+
+
+_lock = threading.Lock()
+_throughput: dict[str, float] = {}
+_recent = deque(maxlen=200)
+
+
+def _tokens_per_second(model: str) -> float:
+    with _lock:
+        return _throughput.get(model, DEFAULT_TOKENS_PER_SECOND)
+
+
+def route(stage: str, prompt_tokens: int, expected_output: int = None) -> Route:
+    """Pick the model, output budget and timeout for one call of a pipeline stage."""
+    profile = STAGES[stage]
+    if expected_output is None:
+        expected_output = profile["min_output"]
+    max_tokens = int(min(profile["max_output"], max(profile["min_output"], expected_output)))
+
+    model = FAST_MODEL
+    if profile["large_above"] is not None and prompt_tokens > profile["large_above"]:
+        model = LARGE_MODEL
+
+    # Leave room for the observed generation speed, but never wait less than the SLO
+    expected_seconds = REQUEST_OVERHEAD_SECONDS + max_tokens / _tokens_per_second(model)
+    timeout = min(MAX_TIMEOUT_SECONDS, max(profile["slo"], 2 * expected_seconds))
+
+    return Route(stage=stage, model=model, max_tokens=max_tokens, timeout=timeout, prompt_tokens=prompt_tokens)
+
+
+def record(decision: Route, seconds: float, completion_tokens: int = None, cached_tokens: int = None):
+    """Record a routed call's latency; output throughput feeds later timeouts."""
+    metrics.observe("llm_stage_seconds", seconds, stage=decision.stage, model=decision.model)
+    if seconds > STAGES[decision.stage]["slo"]:
+        metrics.incr("llm_stage_slo_missed", stage=decision.stage, model=decision.model)
+    with _lock:
+        if completion_tokens and seconds > REQUEST_OVERHEAD_SECONDS:
+            rate = completion_tokens / (seconds - REQUEST_OVERHEAD_SECONDS)
+            previous = _throughput.get(decision.model)
+            _throughput[decision.model] = rate if previous is None else (
+                EWMA_ALPHA * rate + (1 - EWMA_ALPHA) * previous
+            )
+        _recent.append({
+            **asdict(decision),
+            "seconds": round(seconds, 3),
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+        })
+
+
+def recent_decisions() -> list[dict]:
+    with _lock:
+        return list(_recent)
@@ -1,32 +1,68 @@
 import asyncio
 import functools
-from openai import OpenAI, APIConnectionError, RateLimitError, APIStatusError
+import logging
+import threading
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 import os
 import json
 import re
+from functools import reduce
+from pydantic import BaseModel
 from database import get_db_connection
+from models.schemas import AnalysisPayload, PaperPayload, AnswerPayload
+from services.llm_scheduler import (
+    scheduler,
+    estimate_tokens,
+    PRIORITY_OCR,
+    PRIORITY_ANALYSIS,
+    PRIORITY_GENERATION,
+    PRIORITY_ANSWERS,
+)
+from services import metrics
+from services.executors import run_in
+from services.cancellation import on_cancel, raise_if_cancelled
+from services.profiling import span
+from services.model_router import route, record, Route, ANALYSIS_CHUNK_TOKENS
+from services.analysis_merge import merge_analyses
+from services.structured_output import (
+    response_format_for,
+    parse_structured,
+    validate_partial,
+    merge_continuation,
+)
 
-load_dotenv()
+if TYPE_CHECKING:
+    from openai import OpenAI
 
-# Global client with synchronous transport and timeout
-# We will run this in threads to avoid blocking the event loop
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    timeout=300.0,
-    max_retries=5
-)
+load_dotenv()
 
-# Constants for cleanup
-JSON_BLOCK_START = r'^```(?:json)?\s*'
-JSON_BLOCK_END = r'\s*```$'
-DEFAULT_MODEL = "gpt-4o-mini"
+logger = logging.getLogger(__name__)
 
-def clean_json_response(content: str) -> str:
-    content = content.strip()
-    content = re.sub(JSON_BLOCK_START, '', content)
-    content = re.sub(JSON_BLOCK_END, '', content)
-    return content
+# Global client with synchronous transport and timeout
+# We will run this in threads to avoid blocking the event loop.
+# Retries are handled by the shared scheduler, not by the SDK.
+# Built on first use so importing this module doesn't pull in the SDK.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_default_client() -> "OpenAI":
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    timeout=300.0,
+                    max_retries=0
+                )
+    return _client
+
+# Follow-up calls allowed to fill in a truncated or incomplete structured response
+MAX_CONTINUATIONS = 2
 
 def increment_user_credits(user_id: int):
     """Increment the credit count for a user in the database."""
@@ -39,48 +75,196 @@ def increment_user_credits(user_id: int):
         cur.close()
         conn.close()
     except Exception as e:
-        print(f"Error incrementing credits for user {user_id}: {e}")
+        logger.error("Error incrementing credits for user %s: %s", user_id, e)
 
-async def analyze_questions(extracted_texts: list[str], api_key: str = None, user_id: int = None) -> dict:
-    """Analyze question papers and return pattern analysis."""
-    c = client
+def _client_for(api_key: str = None, timeout: float = 300.0) -> "OpenAI":
     if api_key:
-        c = OpenAI(api_key=api_key, timeout=300.0)
+        from openai import OpenAI
+        return OpenAI(api_key=api_key, timeout=timeout, max_retries=0)
+    return get_default_client()
+
 
-    combined_text = "\n\n---PAPER SEPARATOR---\n\n".join(extracted_texts)
+STAGE_PRIORITIES = {
+    "ocr": PRIORITY_OCR,
+    "analysis": PRIORITY_ANALYSIS,
+    "generation": PRIORITY_GENERATION,
+    "answers": PRIORITY_ANSWERS,
+}
 
-    prompt = f"""You are an expert academic question paper analyzer. Analyze the following question papers carefully.
 
-QUESTION PAPERS:
-{combined_text}
+class _StreamedResponse:
+    """A streamed completion collected in the worker thread.
+
+    Exposes `headers` and `parse()` like the SDK's raw response, with `parse()`
+    returning a completion-shaped object (choices[0].message.content, usage).
+    """
+
+    def __init__(self, headers, content: str, finish_reason: str, usage):
+        self.headers = headers
+        self._completion = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)],
+            usage=usage,
+        )
+
+    def parse(self):
+        return self._completion
+
+
+def _stream_completion(create, **kwargs) -> _StreamedResponse:
+    # Streaming lets a cancelled call stop between chunks instead of waiting for
+    # the whole completion; closing the stream also interrupts a blocked read.
+    raw = create(stream=True, stream_options={"include_usage": True}, **kwargs)
+    stream = raw.parse()
+    on_cancel(stream.close)
+    parts, finish_reason, usage = [], None, None
+    try:
+        for chunk in stream:
+            raise_if_cancelled()
+            if chunk.usage is not None:
+                usage = chunk.usage
+            for choice in chunk.choices:
+                if choice.delta.content:
+                    parts.append(choice.delta.content)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+    finally:
+        stream.close()
+    raise_if_cancelled()
+    return _StreamedResponse(raw.headers, "".join(parts), finish_reason, usage)
+
+
+async def _create_completion(c: "OpenAI", decision: Route, **kwargs):
+    """Send a routed chat completion through the shared rate-limited scheduler."""
+    kwargs.update(model=decision.model, max_tokens=decision.max_tokens)
+
+    def on_complete(seconds, response):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            record(decision, seconds)
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        metrics.incr("llm_prompt_tokens", usage.prompt_tokens, stage=decision.stage)
+        metrics.incr("llm_cached_prompt_tokens", cached, stage=decision.stage)
+        record(decision, seconds, usage.completion_tokens, cached_tokens=cached)
+
+    return await scheduler.submit(
+        c.api_key,
+        STAGE_PRIORITIES[decision.stage],
+        estimate_tokens(kwargs["messages"], decision.max_tokens),
+        functools.partial(
+            _stream_completion,
+            c.with_options(timeout=decision.timeout).chat.completions.with_raw_response.create,
+            **kwargs,
+        ),
+        on_complete=on_complete,
+    )
+
+
+def _continuation_prompt(data: dict, missing: list[str], truncated_field: str = None) -> str:
+    keys = list(missing)
+    lines = ["Your previous JSON response was cut off or incomplete. Do not repeat anything already sent."]
+    if truncated_field:
+        if truncated_field not in keys:
+            keys.append(truncated_field)
+        lines.append(
+            f'For "{truncated_field}", return only the items that come after the '
+            f"{len(data.get(truncated_field, []))} already listed."
+        )
+    lines.append(f"Return ONLY a JSON object with these keys: {', '.join(keys)}.")
+    return "\n".join(lines)
+
+
+async def _structured_completion(
+    c: "OpenAI",
+    instructions: str,
+    payload: str,
+    schema: type[BaseModel],
+    temperature: float,
+    stage: str,
+    expected_output: int = None,
+    seed: int = None,
+) -> dict:
+    """Run a schema-constrained completion.
+
+    `instructions` (static text and output format) go first as the system message
+    and the variable `payload` follows as the user message. The instructions alone
+    are shorter than the 1024 tokens prompt caching needs, so only calls that
+    repeat a payload hit the cache: continuations and the variants of one analysis.
+    The model, output budget and timeout are picked from the prompt size and stage.
+    Malformed or truncated output is repaired and the valid items kept; only the
+    missing fields (or the rest of a cut-off list) are requested again.
+    """
+    messages = [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": payload},
+    ]
+    decision = route(stage, estimate_tokens(messages), expected_output)
+    sampling = {"temperature": temperature}
+    if seed is not None:
+        sampling["seed"] = seed
+    response = await _create_completion(
+        c,
+        decision,
+        messages=messages,
+        response_format=response_format_for(schema),
+        **sampling,
+    )
+    with span("json:parse_structured"):
+        data, missing, truncated_field = parse_structured(response.choices[0].message.content, schema)
+
+    for _ in range(MAX_CONTINUATIONS):
+        if not missing and not truncated_field:
+            break
+        response = await _create_completion(
+            c,
+            decision,
+            messages=messages + [
+                {"role": "assistant", "content": json.dumps(data)},
+                {"role": "user", "content": _continuation_prompt(data, missing, truncated_field)},
+            ],
+            response_format={"type": "json_object"},
+            **sampling,
+        )
+        with span("json:parse_structured"):
+            extra, _, truncated_field = parse_structured(response.choices[0].message.content, schema)
+            data, missing = validate_partial(merge_continuation(data, extra), schema)
 
-Analyze these papers and return a JSON response with the following structure:
-{{
+    if missing:
+        raise ValueError(f"Response is missing required fields: {', '.join(missing)}")
+    return data
+
+
+ANALYSIS_INSTRUCTIONS = """You are an expert academic question paper analyzer. Analyze the question papers in the user message carefully.
+
+Return a JSON response with the following structure:
+{
+  "subject": "<Subject Name>",
   "total_questions": <number>,
   "topics": [
-    {{
+    {
       "topic": "<topic name>",
       "count": <how many times this topic appeared>,
       "years": ["<year1>", "<year2>"],
       "percentage": <percentage of total questions>
-    }}
+    }
   ],
-  "year_distribution": {{"<year>": <question count>}},
+  "year_distribution": {"<year>": <question count>},
   "predicted_topics": ["<topic most likely to appear this year>", ...],
   "pattern_insights": [
     "<insight about question patterns>",
     ...
   ],
   "all_questions": [
-    {{
+    {
       "question": "<full question text>",
       "marks": <marks>,
       "topic": "<topic>",
       "year": "<year if identifiable>",
       "section": "<section A/B/C if identifiable>"
-    }}
+    }
   ]
-}}
+}
 
 Be thorough in identifying:
 1. Recurring topics and their frequency
@@ -91,40 +275,75 @@ Be thorough in identifying:
 
 Return ONLY valid JSON, no markdown or explanation."""
 
+
+def _analysis_payload(texts: list[str]) -> str:
+    combined_text = "\n\n---PAPER SEPARATOR---\n\n".join(texts)
+    return f"QUESTION PAPERS:\n{combined_text}"
+
+
+def _chunk_texts(texts: list[str], max_tokens: int) -> list[list[str]]:
+    """Group papers into chunks of at most ~max_tokens, splitting oversized papers at page breaks."""
+    pieces = []
+    for text in texts:
+        if len(text) // 4 <= max_tokens:
+            pieces.append(text)
+            continue
+        header = text.split("\n", 1)[0] if text.startswith("[FILE:") else ""
+        current = ""
+        for page in re.split(r"(?=\n\n\[Page \d+\])", text):
+            if current and (len(current) + len(page)) // 4 > max_tokens:
+                pieces.append(current)
+                current = f"{header} (continued)\n" if header else ""
+            current += page
+        if current:
+            pieces.append(current)
+
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        tokens = len(piece) // 4
+        if current and size + tokens > max_tokens:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def _analyze_chunk(c: "OpenAI", texts: list[str]) -> dict:
+    payload = _analysis_payload(texts)
+    # The question list restates most of the input, so budget output by input size
+    expected_output = int(len(payload) // 4 * 0.8) + 1000
+    return await _structured_completion(
+        c, ANALYSIS_INSTRUCTIONS, payload, AnalysisPayload,
+        temperature=0.3, stage="analysis", expected_output=expected_output,
+    )
+
+
+async def analyze_questions(extracted_texts: list[str], api_key: str = None, user_id: int = None) -> dict:
+    """Analyze question papers and return pattern analysis.
+
+    Large sets of papers are analyzed in chunks concurrently and merged.
+    """
+    c = _client_for(api_key)
+
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None, 
-            functools.partial(
-                c.chat.completions.create,
-                model=DEFAULT_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=4000
-            )
-        )
+        chunks = _chunk_texts(extracted_texts, ANALYSIS_CHUNK_TOKENS)
+        results = await asyncio.gather(*(_analyze_chunk(c, chunk) for chunk in chunks))
+        result = reduce(merge_analyses, results)
         if user_id:
-            await asyncio.to_thread(increment_user_credits, user_id)
-        content = clean_json_response(response.choices[0].message.content)
-        return json.loads(content)
+            await run_in("db", increment_user_credits, user_id)
+        return result
     except Exception as e:
-        print(f"Error in analyze_questions: {e}")
+        logger.error("Error in analyze_questions: %s", e)
         raise ValueError(f"Failed to analyze questions: {str(e)}")
 
 
-async def generate_question_paper(analysis: dict, api_key: str = None, user_id: int = None) -> dict:
-    """Generate a predicted question paper based on analysis."""
-    c = client
-    if api_key:
-        c = OpenAI(api_key=api_key, timeout=300.0)
-
-    prompt = f"""You are an expert academic question paper setter. Based on the following analysis of past question papers, create a comprehensive predicted question paper for this year.
-
-ANALYSIS DATA:
-{json.dumps(analysis, indent=2)}
+PAPER_INSTRUCTIONS = """You are an expert academic question paper setter. Based on the summary of past question papers in the user message, create a comprehensive predicted question paper for this year.
 
 Create a well-structured question paper following the same pattern as the analyzed papers. Return a JSON response:
-{{
+{
   "title": "<Subject Name> - Predicted Question Paper 2026",
   "subject": "<Subject Name>",
   "total_marks": <total marks>,
@@ -135,73 +354,98 @@ Create a well-structured question paper following the same pattern as the analyz
     ...
   ],
   "sections": [
-    {{
+    {
       "name": "Section A",
       "instructions": "<section specific instructions>",
       "total_marks": <marks for this section>,
       "questions": [
-        {{
+        {
           "number": 1,
           "question": "<full question text>",
           "marks": <marks>,
           "section": "A",
           "topic": "<topic>"
-        }}
+        }
       ]
-    }}
+    }
   ]
-}}
+}
 
 Rules:
-1. Focus on predicted_topics from the analysis
-2. Include topics that appear frequently
-3. Include topics that haven't appeared recently (overdue)
-4. Match the mark distribution pattern from past papers
+1. Prioritise topics in the order of ranked_topics (highest score first)
+2. Give topics roughly their expected_mark_share of the total marks
+3. Include topics marked overdue
+4. Match the section and mark pattern of past papers (paper_pattern)
 5. Create original questions (not copies from past papers)
 6. Ensure questions are academically rigorous
 7. Follow the same section structure as past papers
 
 Return ONLY valid JSON, no markdown or explanation."""
 
+
+def analysis_context(analysis: dict) -> str:
+    """Compact generation context: ranked topics and the paper pattern, not every past question.
+
+    Serialized once so several generation prompts can share it.
+    """
+    from services.topic_forecast import forecast_topics, paper_pattern
+    with span("forecast"):
+        forecast = analysis.get("topic_forecast") or forecast_topics(analysis)
+    if forecast:
+        ranked = [
+            {k: t[k] for k in ("topic", "score", "expected_mark_share", "overdue", "last_seen")}
+            for t in forecast
+        ]
+    else:
+        # No usable years in the papers: fall back to the model's own topic statistics
+        ranked = [{"topic": t["topic"], "count": t.get("count", 0)} for t in analysis.get("topics", [])]
+    context = {
+        "subject": analysis.get("subject"),
+        "total_questions": analysis.get("total_questions"),
+        "year_distribution": analysis.get("year_distribution", {}),
+        "ranked_topics": ranked,
+        "paper_pattern": paper_pattern(analysis),
+        "pattern_insights": analysis.get("pattern_insights", []),
+    }
+    with span("json:analysis_context"):
+        return json.dumps(context, separators=(",", ":"), ensure_ascii=False)
+
+
+async def generate_question_paper(
+    analysis: dict,
+    api_key: str = None,
+    user_id: int = None,
+    temperature: float = 0.7,
+    seed: int = None,
+    focus_topics: list[str] = None,
+    context: str = None,
+) -> dict:
+    """Generate a predicted question paper based on analysis.
+
+    Variants pass a pre-serialized `context` shared between calls, plus their own
+    sampling settings and `focus_topics`.
+    """
+    c = _client_for(api_key)
+
+    payload = f"ANALYSIS DATA:\n{context if context is not None else analysis_context(analysis)}"
+    if focus_topics:
+        # Kept at the end so variants share the rest of the prompt
+        payload += f"\n\nFor this version of the paper, give extra weight to: {', '.join(focus_topics)}."
+
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            functools.partial(
-                c.chat.completions.create,
-                model=DEFAULT_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=4000
-            )
+        result = await _structured_completion(
+            c, PAPER_INSTRUCTIONS, payload, PaperPayload, temperature=temperature,
+            stage="generation", expected_output=4000, seed=seed,
         )
         if user_id:
-            await asyncio.to_thread(increment_user_credits, user_id)
-        content = clean_json_response(response.choices[0].message.content)
-        return json.loads(content)
+            await run_in("db", increment_user_credits, user_id)
+        return result
     except Exception as e:
-        print(f"Error in generate_question_paper: {e}")
+        logger.error("Error in generate_question_paper: %s", e)
         raise ValueError(f"Failed to generate paper: {str(e)}")
 
 
-async def generate_answers(paper: dict, api_key: str = None, user_id: int = None) -> dict:
-    """Generate mark-appropriate answers for each question."""
-    c = client
-    if api_key:
-        c = OpenAI(api_key=api_key, timeout=300.0)
-
-    all_questions = []
-    for section in paper.get("sections", []):
-        for q in section.get("questions", []):
-            all_questions.append(q)
-
-    prompt = f"""You are an expert academic teacher. Provide comprehensive, mark-appropriate answers for the following exam questions.
-
-SUBJECT: {paper.get('subject', 'General')}
-EXAM: {paper.get('title', 'Question Paper')}
-
-QUESTIONS:
-{json.dumps(all_questions, indent=2)}
+ANSWER_INSTRUCTIONS = """You are an expert academic teacher. Provide comprehensive, mark-appropriate answers for the exam questions in the user message.
 
 For each question, provide an answer that:
 - Is appropriate for the marks allocated (1 mark = brief, 2-3 marks = moderate detail, 5+ marks = comprehensive with points/diagrams mentioned)
@@ -210,84 +454,148 @@ For each question, provide an answer that:
 - Includes key terms and concepts
 
 Return a JSON response:
-{{
+{
   "answered_questions": [
-    {{
+    {
       "number": <question number>,
       "question": "<question text>",
       "marks": <marks>,
       "section": "<section>",
       "answer": "<comprehensive answer>"
-    }}
+    }
   ]
-}}
+}
 
 Return ONLY valid JSON, no markdown or explanation."""
 
+
+def _answers_payload(paper: dict, questions: list[dict]) -> str:
+    return f"""SUBJECT: {paper.get('subject', 'General')}
+EXAM: {paper.get('title', 'Question Paper')}
+
+QUESTIONS:
+{json.dumps(questions, indent=2)}"""
+
+
+def _expected_answer_tokens(questions: list[dict]) -> int:
+    # Answers are sized by marks: roughly 120 tokens per mark plus the restated question
+    marks = sum(max(int(q.get("marks") or 1), 1) for q in questions)
+    return marks * 120 + 60 * len(questions)
+
+
+def _answer_key(item: dict) -> tuple:
+    # Numbering may restart in every section, so a number alone is ambiguous
+    return str(item.get("section") or "").strip().lower(), item.get("number")
+
+
+def _match_answers(questions: list[dict], answers: list[dict], matched: dict):
+    """Assign answers to question positions in `matched`, keeping the first answer per question.
+
+    Answers are matched on (section, number); one whose section label matches
+    no question (e.g. "Section A" for "A") falls back to the first unanswered
+    question with its number. Answers matching nothing are dropped.
+    """
+    by_key = {}
+    by_number: dict = {}
+    for i, q in enumerate(questions):
+        by_key.setdefault(_answer_key(q), i)
+        by_number.setdefault(q.get("number"), []).append(i)
+    unmatched = []
+    for answer in answers:
+        i = by_key.get(_answer_key(answer))
+        if i is None:
+            unmatched.append(answer)
+        elif i not in matched:
+            matched[i] = answer
+    # Exact matches go first so a relabelled answer can't take another question's place
+    for answer in unmatched:
+        i = next((j for j in by_number.get(answer.get("number"), []) if j not in matched), None)
+        if i is not None:
+            matched[i] = answer
+
+
+async def generate_answers(paper: dict, api_key: str = None, user_id: int = None) -> dict:
+    """Generate mark-appropriate answers for each question."""
+    c = _client_for(api_key)
+
+    all_questions = []
+    for section in paper.get("sections", []):
+        for q in section.get("questions", []):
+            all_questions.append({**q, "section": q.get("section") or section.get("name")})
+
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            functools.partial(
-                c.chat.completions.create,
-                model=DEFAULT_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=6000
-            )
+        result = await _structured_completion(
+            c, ANSWER_INSTRUCTIONS, _answers_payload(paper, all_questions), AnswerPayload,
+            temperature=0.3, stage="answers", expected_output=_expected_answer_tokens(all_questions),
         )
+
+        matched = {}
+        _match_answers(all_questions, result["answered_questions"], matched)
+
+        # Regenerate only the questions the model skipped, not the whole set
+        remaining = [i for i in range(len(all_questions)) if i not in matched]
+        if remaining:
+            questions = [all_questions[i] for i in remaining]
+            extra = await _structured_completion(
+                c, ANSWER_INSTRUCTIONS, _answers_payload(paper, questions), AnswerPayload,
+                temperature=0.3, stage="answers", expected_output=_expected_answer_tokens(questions),
+            )
+            retried = {}
+            _match_answers(questions, extra["answered_questions"], retried)
+            matched.update({remaining[j]: answer for j, answer in retried.items()})
+
+        result["answered_questions"] = [matched[i] for i in sorted(matched)]
+
         if user_id:
-            await asyncio.to_thread(increment_user_credits, user_id)
-        content = clean_json_response(response.choices[0].message.content)
-        return json.loads(content)
+            await run_in("db", increment_user_credits, user_id)
+        return result
     except Exception as e:
-        print(f"Error in generate_answers: {e}")
+        logger.error("Error in generate_answers: %s", e)
         raise ValueError(f"Failed to generate answers: {str(e)}")
 
 
 async def extract_text_from_image(image_base64: str, api_key: str = None, user_id: int = None) -> str:
     """Use GPT-4o Vision to extract question text from an image."""
-    c = client
-    if api_key:
-        c = OpenAI(api_key=api_key, timeout=60.0)
+    from openai import APIConnectionError, RateLimitError, APIStatusError
+    c = _client_for(api_key, timeout=60.0)
+
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": "Extract all the text from this question paper image. Preserve the structure including question numbers, marks, sections, and all text. Return only the extracted text."
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
+                }
+            ]
+        }
+    ]
 
     try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            functools.partial(
-                c.chat.completions.create,
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Extract all the text from this question paper image. Preserve the structure including question numbers, marks, sections, and all text. Return only the extracted text."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=3000
-            )
+        response = await _create_completion(
+            c,
+            route("ocr", estimate_tokens(messages), expected_output=3000),
+            messages=messages,
         )
         if user_id:
-            await asyncio.to_thread(increment_user_credits, user_id)
+            await run_in("db", increment_user_credits, user_id)
         return response.choices[0].message.content.strip()
     except APIConnectionError as e:
-        print(f"OpenAI Connection Error: {e}")
+        logger.error("OpenAI connection error: %s", e, extra={"sample": "openai_error"})
         raise ValueError(f"OpenAI connection failed. Details: {e}")
     except RateLimitError as e:
-        print(f"OpenAI Rate Limit Error: {e}")
+        logger.warning("OpenAI rate limit error: %s", e, extra={"sample": "openai_error"})
         raise ValueError("OpenAI rate limit reached.")
     except APIStatusError as e:
-        print(f"OpenAI API Status Error: {e.status_code} - {e.response.text}")
+        logger.error(
+            "OpenAI API status error",
+            extra={"status": e.status_code, "response": e.response.text, "sample": "openai_error"},
+        )
         raise ValueError(f"OpenAI API error ({e.status_code}).")
     except Exception as e:
-        print(f"OpenAI Unexpected Error: {type(e).__name__} - {e}")
+        logger.exception("OpenAI unexpected error: %s", type(e).__name__, extra={"sample": "openai_error"})
         raise ValueError(f"An unexpected error occurred: {str(e)}")
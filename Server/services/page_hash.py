@@ -0,0 +1,141 @@
+import os
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+from services import metrics
+
+# Hash algorithm for scanned pages: "phash" (DCT, robust to rescans) or "dhash" (gradient, cheaper)
+HASH_ALGORITHM = os.getenv("OCR_DEDUP_ALGORITHM", "phash")
+# Max differing bits (out of 64) for two pages to count as the same page
+MAX_DISTANCE = int(os.getenv("OCR_DEDUP_MAX_DISTANCE", "6"))
+# Pages remembered per worker process (about 1 KiB each plus their text)
+INDEX_SIZE = int(os.getenv("OCR_DEDUP_INDEX_SIZE", "5000"))
+# Hash matches are confirmed on a small thumbnail: mean absolute pixel difference (0-255).
+# Dense text pages with the same layout can share a 64-bit hash, so this keeps them apart.
+MAX_PIXEL_DIFF = float(os.getenv("OCR_DEDUP_MAX_PIXEL_DIFF", "10"))
+_THUMB_SIZE = (32, 32)
+# Hash candidates to verify against their thumbnails per lookup
+_MAX_CANDIDATES = 5
+
+# Owner of a slot that holds no page
+_FREE = -1
+
+_PHASH_SIZE = 32
+_PHASH_KEEP = 8
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_PHASH_SIZE)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def dhash(image) -> int:
+    """64-bit difference hash of a grayscale PIL image."""
+    small = np.asarray(image.convert("L").resize((9, 8)), dtype=np.int16)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(image) -> int:
+    """64-bit DCT perceptual hash of a grayscale PIL image."""
+    small = np.asarray(image.convert("L").resize((_PHASH_SIZE, _PHASH_SIZE)), dtype=np.float64)
+    low = (_DCT @ small @ _DCT.T)[:_PHASH_KEEP, :_PHASH_KEEP]
+    # Compare against the median of the low frequencies, ignoring the DC term
+    median = np.median(low.ravel()[1:])
+    return _bits_to_int(low > median)
+
+
+def fingerprint(image) -> tuple[int, np.ndarray, float]:
+    """Perceptual hash, verification thumbnail and its mean brightness of a grayscale page."""
+    gray = image.convert("L")
+    value = dhash(gray) if HASH_ALGORITHM == "dhash" else phash(gray)
+    thumb = np.asarray(gray.resize(_THUMB_SIZE), dtype=np.uint8)
+    return value, thumb, float(thumb.mean())
+
+
+def _thumb_difference(a: np.ndarray, a_mean: float, b: np.ndarray, b_mean: float) -> float:
+    # Remove overall brightness so rescans with different exposure still compare equal
+    return float(np.abs((a.astype(np.float32) - a_mean) - (b.astype(np.float32) - b_mean)).mean())
+
+
+class PageHashIndex:
+    """Bounded index of page fingerprints to previously OCR'd text.
+
+    Every entry belongs to the user whose upload was OCR'd, and lookups only
+    match that user's pages, so one user's text is never returned to another.
+    Lookups compare against every stored hash at once (XOR + popcount over a
+    uint64 array); the closest pages within `max_distance` bits are confirmed
+    on their thumbnails before their text is reused.
+    """
+
+    def __init__(self, max_distance: int = MAX_DISTANCE, size: int = INDEX_SIZE):
+        self.max_distance = max_distance
+        self.size = size
+        # Fixed slots, so inserting or evicting a page never rebuilds the arrays.
+        # Distinct pages may share a hash; each keeps its own slot.
+        self._hashes = np.zeros(size, dtype=np.uint64)
+        self._owners = np.full(size, _FREE, dtype=np.int64)
+        self._thumbs: list = [None] * size
+        self._texts: list = [None] * size
+        # Occupied slots, least recently used first
+        self._order: OrderedDict[int, None] = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+        self._checked: Counter = Counter()
+        self._skipped: Counter = Counter()
+
+    def lookup(self, owner: int, page: tuple[int, np.ndarray, float]) -> str | None:
+        value, thumb, mean = page
+        with self._lock:
+            self._checked[owner] += 1
+            metrics.incr("ocr_dedup_checked")
+            if not self._used:
+                return None
+            diff = np.bitwise_xor(self._hashes[:self._used], np.uint64(value))
+            distances = np.unpackbits(diff.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+            candidates = np.flatnonzero((distances <= self.max_distance) & (self._owners[:self._used] == owner))
+            for slot in candidates[np.argsort(distances[candidates])][:_MAX_CANDIDATES]:
+                slot = int(slot)
+                if _thumb_difference(*self._thumbs[slot], thumb, mean) <= MAX_PIXEL_DIFF:
+                    self._order.move_to_end(slot)
+                    self._skipped[owner] += 1
+                    metrics.incr("ocr_dedup_skipped")
+                    return self._texts[slot]
+            return None
+
+    def add(self, owner: int, page: tuple[int, np.ndarray, float], text: str):
+        value, thumb, mean = page
+        with self._lock:
+            if self._used < self.size:
+                slot = self._used
+                self._used += 1
+            else:
+                slot, _ = self._order.popitem(last=False)
+            self._hashes[slot] = value
+            self._owners[slot] = owner
+            self._thumbs[slot] = (thumb, mean)
+            self._texts[slot] = text
+            self._order[slot] = None
+
+    def report(self, owner: int) -> dict:
+        with self._lock:
+            return {
+                "algorithm": HASH_ALGORITHM,
+                "max_distance": self.max_distance,
+                "max_pixel_diff": MAX_PIXEL_DIFF,
+                "indexed_pages": int((self._owners == owner).sum()),
+                "checked": self._checked[owner],
+                "skipped_ocr_calls": self._skipped[owner],
+            }
+
+
+page_index = PageHashIndex()
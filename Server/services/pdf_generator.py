@@ -5,6 +5,12 @@ from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, HRFlowable, Table, TableStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
 import io
+from services.cancellation import raise_if_cancelled
+
+
+def _check_cancelled(canvas, doc):
+    # Called by ReportLab per page, so an abandoned render stops early
+    raise_if_cancelled()
 
 
 def create_question_paper_pdf(paper: dict) -> bytes:
@@ -116,7 +122,7 @@ def create_question_paper_pdf(paper: dict) -> bytes:
 
         story.append(Spacer(1, 0.3 * cm))
 
-    doc.build(story)
+    doc.build(story, onFirstPage=_check_cancelled, onLaterPages=_check_cancelled)
     buffer.seek(0)
     return buffer.read()
 
@@ -180,6 +186,6 @@ def create_answer_pdf(answer_set: dict, paper_title: str = "") -> bytes:
         story.append(Paragraph(f"<b>Answer:</b> {answer_text}", answer_style))
         story.append(HRFlowable(width="100%", thickness=0.5, color=colors.HexColor("#dddddd")))
 
-    doc.build(story)
+    doc.build(story, onFirstPage=_check_cancelled, onLaterPages=_check_cancelled)
     buffer.seek(0)
     return buffer.read()
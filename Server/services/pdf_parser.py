@@ -1,25 +1,152 @@
-import fitz  # PyMuPDF
 import base64
-from PIL import Image
+import logging
+import os
 import io
 from services.openai_service import extract_text_from_image
+from services.executors import PDF_WORKERS, get_process_pool, run_in
+from services.cancellation import raise_if_cancelled
+
+logger = logging.getLogger(__name__)
+
+# Documents with at least this many pages are split across a process pool
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+MIN_PAGES_PER_CHUNK = 8
+# Horizontal slack (fraction of page width) when deciding whether a block crosses the gutter
+COLUMN_GUTTER = 0.04
+
+def _reading_order(blocks: list[dict], page_width: float) -> list[dict]:
+    """Order text blocks for reading, handling two-column exam layouts.
+
+    Full-width blocks (headers, instructions) split the page into bands; inside a
+    band the left column is read top to bottom before the right one. Pages that
+    don't look like two columns keep plain top-to-bottom, left-to-right order so
+    right-aligned marks stay next to their question.
+    """
+    mid = page_width / 2
+    gutter = page_width * COLUMN_GUTTER
+    wide = page_width * 0.3
+
+    for block in blocks:
+        x0, _, x1, _ = block["bbox"]
+        if x0 < mid - gutter and x1 > mid + gutter:
+            block["column"] = "full"
+        else:
+            block["column"] = "left" if (x0 + x1) / 2 < mid else "right"
+
+    def is_column_body(block, column):
+        x0, _, x1, _ = block["bbox"]
+        return block["column"] == column and x1 - x0 >= wide
+
+    two_columns = (
+        sum(is_column_body(b, "left") for b in blocks) >= 2
+        and sum(is_column_body(b, "right") for b in blocks) >= 2
+    )
+    if not two_columns:
+        for block in blocks:
+            block["column"] = "full"
+        return sorted(blocks, key=lambda b: (round(b["bbox"][1]), b["bbox"][0]))
+
+    ordered = []
+    band = []
+
+    def flush():
+        band.sort(key=lambda b: (b["column"] != "left", b["bbox"][1]))
+        ordered.extend(band)
+        band.clear()
+
+    for block in sorted(blocks, key=lambda b: (b["bbox"][1], b["bbox"][0])):
+        if block["column"] == "full":
+            flush()
+            ordered.append(block)
+        else:
+            band.append(block)
+    flush()
+    return ordered
+
+
+def _extract_page(page) -> dict:
+    blocks = [
+        {"bbox": [round(v, 1) for v in b[:4]], "text": b[4].strip()}
+        for b in page.get_text("blocks")
+        if b[6] == 0 and b[4].strip()
+    ]
+    blocks = _reading_order(blocks, page.rect.width)
+    return {
+        "page": page.number + 1,
+        "text": "\n".join(b["text"] for b in blocks),
+        "blocks": blocks,
+    }
+
+
+def _extract_page_range(file_bytes: bytes, start: int, end: int) -> list[dict]:
+    # Runs in a worker process, so it opens its own copy of the document
+    import fitz  # PyMuPDF
+    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    try:
+        return [_extract_page(doc[i]) for i in range(start, end)]
+    finally:
+        doc.close()
+
+
+def iter_pdf_pages(file_bytes: bytes):
+    """Yield pages in order as {"page", "text", "blocks"} dicts.
+
+    Large documents are split into page ranges extracted in parallel worker
+    processes; pages are yielded as soon as their range is done so callers can
+    start on the first pages while later ones are still being parsed.
+    """
+    import fitz  # PyMuPDF
+    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    page_count = len(doc)
+
+    if page_count < PARALLEL_MIN_PAGES:
+        try:
+            for page in doc:
+                raise_if_cancelled()
+                yield _extract_page(page)
+        finally:
+            doc.close()
+        return
+
+    doc.close()
+    pool = get_process_pool()
+    chunk = max(MIN_PAGES_PER_CHUNK, -(-page_count // PDF_WORKERS))
+    futures = [
+        pool.submit(_extract_page_range, file_bytes, start, min(start + chunk, page_count))
+        for start in range(0, page_count, chunk)
+    ]
+    try:
+        for future in futures:
+            raise_if_cancelled()
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
 
 
 def extract_text_from_pdf(file_bytes: bytes) -> str:
     """Extract text from a PDF file using PyMuPDF."""
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
     text_parts = []
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        text = page.get_text()
-        if text.strip():
-            text_parts.append(f"[Page {page_num + 1}]\n{text}")
-    doc.close()
+    for page in iter_pdf_pages(file_bytes):
+        if page["text"].strip():
+            text_parts.append(f"[Page {page['page']}]\n{page['text']}")
     return "\n\n".join(text_parts)
 
 
-async def extract_text_from_image_file(file_bytes: bytes, api_key: str = None, user_id: int = None) -> str:
-    """Extract text from an image file using GPT-4o Vision."""
+def _render_first_page(file_bytes: bytes) -> bytes:
+    import fitz  # PyMuPDF
+    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    page = doc[0]
+    pix = page.get_pixmap(matrix=fitz.Matrix(1.2, 1.2))
+    img_bytes = pix.tobytes("png")
+    doc.close()
+    return img_bytes
+
+
+def _prepare_image(file_bytes: bytes):
+    """Decode, grayscale and shrink an uploaded page; returns the image and its fingerprint."""
+    from PIL import Image
+    from services.page_hash import fingerprint
     # ... grayscale conversion ...
     image = Image.open(io.BytesIO(file_bytes))
     if image.mode != "L":
@@ -31,13 +158,34 @@ async def extract_text_from_image_file(file_bytes: bytes, api_key: str = None, u
         new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
         image = image.resize(new_size, Image.LANCZOS)
 
+    return image, fingerprint(image)
+
+
+def _encode_image(image) -> str:
     image_1bit = image.point(lambda x: 0 if x < 128 else 255, '1')
     buffer = io.BytesIO()
     image_1bit.save(buffer, format="PNG", optimize=True)
     img_bytes = buffer.getvalue()
-    image_base64 = base64.b64encode(img_bytes).decode("utf-8")
-    
-    return await extract_text_from_image(image_base64, api_key=api_key, user_id=user_id)
+    return base64.b64encode(img_bytes).decode("utf-8")
+
+
+async def extract_text_from_image_file(file_bytes: bytes, api_key: str = None, user_id: int = None) -> str:
+    """Extract text from an image file using GPT-4o Vision."""
+    from services.page_hash import page_index
+    # Image work is CPU-bound; keep it on the OCR threads rather than the event loop
+    image, page = await run_in("ocr", _prepare_image, file_bytes)
+
+    # Rescans and photos of a page this user had OCR'd before reuse its text instead of another Vision call
+    if user_id is not None:
+        known_text = await run_in("ocr", page_index.lookup, user_id, page)
+        if known_text is not None:
+            return known_text
+
+    image_base64 = await run_in("ocr", _encode_image, image)
+    text = await extract_text_from_image(image_base64, api_key=api_key, user_id=user_id)
+    if user_id is not None:
+        await run_in("ocr", page_index.add, user_id, page, text)
+    return text
 
 
 async def process_file(filename: str, file_bytes: bytes, api_key: str = None, user_id: int = None) -> str:
@@ -45,17 +193,15 @@ async def process_file(filename: str, file_bytes: bytes, api_key: str = None, us
     filename_lower = filename.lower()
     
     if filename_lower.endswith(".pdf"):
-        text = extract_text_from_pdf(file_bytes)
+        text = await run_in("pdf", extract_text_from_pdf, file_bytes)
         if len(text.strip()) < 100:
             try:
-                doc = fitz.open(stream=file_bytes, filetype="pdf")
-                page = doc[0]
-                pix = page.get_pixmap(matrix=fitz.Matrix(1.2, 1.2))
-                img_bytes = pix.tobytes("png")
-                doc.close()
+                img_bytes = await run_in("pdf", _render_first_page, file_bytes)
                 text = await extract_text_from_image_file(img_bytes, api_key=api_key, user_id=user_id)
             except Exception as vision_err:
-                print(f"Vision fallback failed for {filename}: {vision_err}")
+                logger.warning(
+                    "Vision fallback failed for %s: %s", filename, vision_err, extra={"sample": "vision_fallback_failed"}
+                )
                 if text.strip():
                     return text
                 raise ValueError(f"Could not extract text from PDF (Vision API error: {vision_err})")
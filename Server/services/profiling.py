@@ -0,0 +1,233 @@
+import contextvars
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import asynccontextmanager, contextmanager
+
+# Requests sending this value in X-Profile-Token are profiled; unset disables the header
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+# Fraction of pipeline requests profiled without the header (0 = never)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+# Sessions whose profiles are kept in memory, oldest dropped first
+PROFILE_MAX_SESSIONS = int(os.getenv("PROFILE_MAX_SESSIONS", "50"))
+MAX_STACK_DEPTH = 64
+MAX_SAMPLES = 200_000
+
+
+class Profile:
+    """Statistical profile and stage timings of one request.
+
+    Stacks are sampled from the event loop thread and from whichever worker
+    threads are running this request's jobs at the time. Event-loop samples can
+    include other requests being served concurrently; worker samples cannot.
+    """
+
+    def __init__(self, session_id: str, stage: str):
+        self.session_id = session_id
+        self.stage = stage
+        self.started_at = time.time()
+        self.wall = None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.spans: dict = defaultdict(lambda: {"count": 0, "wall": 0.0, "cpu": 0.0})
+        self.loop_thread = threading.get_ident()
+        self._threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def enter_thread(self, label: str):
+        with self._lock:
+            self._threads[threading.get_ident()] = label
+
+    def leave_thread(self):
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+
+    def threads(self) -> dict[int, str]:
+        with self._lock:
+            return {self.loop_thread: "event-loop", **self._threads}
+
+    def add_span(self, name: str, wall: float, cpu: float = None):
+        with self._lock:
+            span = self.spans[name]
+            span["count"] += 1
+            span["wall"] += wall
+            if cpu is not None:
+                span["cpu"] += cpu
+
+    def add_sample(self, stack: str):
+        with self._lock:
+            if self.samples < MAX_SAMPLES:
+                self.stacks[stack] += 1
+                self.samples += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "session_id": self.session_id,
+                "stage": self.stage,
+                "started_at": self.started_at,
+                "wall_seconds": round(self.wall, 4) if self.wall is not None else None,
+                "samples": self.samples,
+                "sample_interval_ms": PROFILE_INTERVAL * 1000,
+                "spans": {
+                    name: {"count": s["count"], "wall_seconds": round(s["wall"], 4), "cpu_seconds": round(s["cpu"], 4)}
+                    for name, s in sorted(self.spans.items(), key=lambda item: -item[1]["wall"])
+                },
+            }
+
+    def collapsed(self) -> str:
+        """Folded stacks ("frame;frame;frame count"), as read by flamegraph.pl and speedscope."""
+        with self._lock:
+            return "".join(f"{self.stage};{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _fold(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class _Sampler:
+    """One background thread sampling every active profile's threads."""
+
+    def __init__(self):
+        self._profiles: set[Profile] = set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def attach(self, profile: Profile):
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def detach(self, profile: Profile):
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in profiles:
+                for ident, label in profile.threads().items():
+                    frame = frames.get(ident)
+                    # Skip the event loop while it is idle waiting for I/O
+                    if frame is None or (ident == profile.loop_thread and frame.f_code.co_filename.endswith("selectors.py")):
+                        continue
+                    profile.add_sample(f"{label};{_fold(frame)}")
+            del frames
+            time.sleep(PROFILE_INTERVAL)
+
+
+_sampler = _Sampler()
+_current: contextvars.ContextVar[Profile | None] = contextvars.ContextVar("profile", default=None)
+_profiles: OrderedDict[str, list[Profile]] = OrderedDict()
+_store_lock = threading.Lock()
+
+
+def has_profile_token(request) -> bool:
+    supplied = request.headers.get("x-profile-token")
+    return bool(PROFILE_TOKEN and supplied and hmac.compare_digest(supplied, PROFILE_TOKEN))
+
+
+def _should_profile(request) -> bool:
+    if has_profile_token(request):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _store(profile: Profile):
+    with _store_lock:
+        _profiles.setdefault(profile.session_id, []).append(profile)
+        _profiles.move_to_end(profile.session_id)
+        while len(_profiles) > PROFILE_MAX_SESSIONS:
+            _profiles.popitem(last=False)
+
+
+@asynccontextmanager
+async def profile_request(request, session_id: str, stage: str):
+    """Profile the enclosed work if the request opted in (or was sampled).
+
+    When not profiling this costs one header lookup; everything else checks a
+    context variable and returns.
+    """
+    if not _should_profile(request):
+        yield None
+        return
+    profile = Profile(session_id, stage)
+    token = _current.set(profile)
+    _sampler.attach(profile)
+    started = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.wall = time.perf_counter() - started
+        _sampler.detach(profile)
+        _current.reset(token)
+        _store(profile)
+
+
+@contextmanager
+def span(name: str):
+    """Record wall and CPU time of a synchronous section in the current profile.
+
+    CPU time is the calling thread's, so use it around code that doesn't await.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        profile.add_span(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+
+def record_wait(name: str, seconds: float):
+    """Record time spent waiting (queueing, I/O) in the current profile; no CPU is attributed."""
+    profile = _current.get()
+    if profile is not None:
+        profile.add_span(name, seconds)
+
+
+def traced(workload: str, fn):
+    """Wrap a thread-pool job so its thread is sampled and timed for the current profile."""
+    profile = _current.get()
+    if profile is None:
+        return fn
+    name = f"{workload}:{getattr(fn, '__qualname__', None) or getattr(getattr(fn, 'func', None), '__qualname__', 'job')}"
+
+    def run(*args, **kwargs):
+        profile.enter_thread(f"{workload}-worker")
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.add_span(name, time.perf_counter() - wall, time.thread_time() - cpu)
+            profile.leave_thread()
+
+    return run
+
+
+def session_profiles(session_id: str) -> list[Profile]:
+    with _store_lock:
+        return list(_profiles.get(session_id, []))
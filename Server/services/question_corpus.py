@@ -0,0 +1,159 @@
+import hashlib
+from psycopg2.extras import Json, execute_values
+from database import get_db_connection, SCHEMA_NAME
+
+SEARCH_PAGE_LIMIT = 100
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").split()).casefold()
+
+
+def content_hash(text: str) -> str:
+    """Hash of an extracted paper text, ignoring the `[FILE: name]` header and whitespace."""
+    if text.startswith("[FILE:"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    return hashlib.sha256(_normalize(text).encode("utf-8")).hexdigest()
+
+
+def batch_hash(hashes: list[str]) -> str:
+    """Cache key for an analysis covering several papers at once."""
+    return hashlib.sha256("|".join(sorted(hashes)).encode("utf-8")).hexdigest()
+
+
+def _question_hash(text: str, subject: str, year: str) -> str:
+    # The same question asked in another year or subject is kept as its own row
+    key = "|".join(_normalize(part) for part in (text, subject or "", year or ""))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def store_questions(analysis: dict, user_id: int):
+    """Add an analysis' questions to the user's corpus, skipping ones already stored."""
+    subject = analysis.get("subject")
+    rows = {}
+    for q in analysis.get("all_questions", []):
+        text = q.get("question")
+        if not text:
+            continue
+        rows[_question_hash(text, subject, q.get("year"))] = (
+            subject,
+            q.get("year"),
+            q.get("topic"),
+            q.get("section"),
+            q.get("marks"),
+            text,
+        )
+    if not rows:
+        return
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f"SET search_path TO {SCHEMA_NAME};")
+    execute_values(
+        cur,
+        """
+        INSERT INTO questions (user_id, content_hash, subject, year, topic, section, marks, question)
+        VALUES %s
+        ON CONFLICT (user_id, content_hash) DO NOTHING
+        """,
+        [(user_id, h, *row) for h, row in rows.items()],
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def load_cached_analyses(hashes: list[str]) -> dict:
+    """Return {key: analysis} for papers, or batches of papers (see batch_hash), analyzed before."""
+    if not hashes:
+        return {}
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f"SET search_path TO {SCHEMA_NAME};")
+    cur.execute(
+        "SELECT content_hash, analysis FROM paper_analyses WHERE content_hash = ANY(%s)",
+        (list(hashes),),
+    )
+    found = {row[0]: row[1] for row in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return found
+
+
+def save_cached_analysis(key: str, analysis: dict):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f"SET search_path TO {SCHEMA_NAME};")
+    cur.execute(
+        """
+        INSERT INTO paper_analyses (content_hash, analysis) VALUES (%s, %s)
+        ON CONFLICT (content_hash) DO UPDATE SET analysis = EXCLUDED.analysis
+        """,
+        (key, Json({k: v for k, v in analysis.items() if k != "session_id"})),
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def search_questions(
+    user_id: int,
+    query: str = None,
+    subject: str = None,
+    year: str = None,
+    topic: str = None,
+    cursor: int = None,
+    limit: int = 20,
+) -> dict:
+    """Full-text search over the user's corpus with keyset pagination on id."""
+    limit = max(1, min(limit, SEARCH_PAGE_LIMIT))
+    conditions = ["user_id = %s"]
+    params = [user_id]
+    if query:
+        conditions.append("search_vector @@ websearch_to_tsquery('english', %s)")
+        params.append(query)
+    if subject:
+        conditions.append("subject = %s")
+        params.append(subject)
+    if year:
+        conditions.append("year = %s")
+        params.append(year)
+    if topic:
+        conditions.append("topic ILIKE %s")
+        params.append(topic)
+    if cursor:
+        conditions.append("id > %s")
+        params.append(cursor)
+    where = f"WHERE {' AND '.join(conditions)}"
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f"SET search_path TO {SCHEMA_NAME};")
+    # Fetch one extra row to know whether there is a next page
+    cur.execute(
+        f"""
+        SELECT id, subject, year, topic, section, marks, question
+        FROM questions {where}
+        ORDER BY id
+        LIMIT %s
+        """,
+        (*params, limit + 1),
+    )
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    items = [
+        {
+            "id": r[0],
+            "subject": r[1],
+            "year": r[2],
+            "topic": r[3],
+            "section": r[4],
+            "marks": r[5],
+            "question": r[6],
+        }
+        for r in rows[:limit]
+    ]
+    next_cursor = items[-1]["id"] if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
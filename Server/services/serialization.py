@@ -0,0 +1,35 @@
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from services.profiling import span
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def parse_fields(fields: str | None, model: type[BaseModel]) -> set | None:
+    """Parse a comma-separated `fields` query parameter into top-level field names."""
+    if not fields:
+        return None
+    selected = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = selected - set(model.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected
+
+
+def typed_response(model: type[BaseModel], data: dict, fields: str | None = None) -> ORJSONResponse:
+    """Validate `data` against its schema model and render only the requested fields."""
+    include = parse_fields(fields, model)
+    with span("json:response"):
+        payload = model.model_validate(data).model_dump(mode="json", include=include)
+        return ORJSONResponse(payload)
+
+
+def paginate(items: list, cursor: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+    """Slice a stored list into a page; the cursor is the offset of the next item."""
+    cursor = max(cursor or 0, 0)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    page = items[cursor:cursor + limit]
+    next_cursor = cursor + limit if cursor + limit < len(items) else None
+    return {"items": page, "next_cursor": next_cursor, "total": len(items)}
@@ -0,0 +1,49 @@
+import asyncio
+from services import metrics
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one in-flight computation.
+
+    The first caller for a key starts the work; callers that arrive while it is
+    still running await the same task and get the same result (or exception).
+    Once it finishes the key is released, so a later call computes afresh.
+    The work is cancelled only when every caller waiting for it was cancelled.
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self._waiters: dict = {}
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda t: self._release(key, t))
+        else:
+            metrics.incr("singleflight_coalesced", stage=key[1] if isinstance(key, tuple) else key)
+        self._waiters[task] += 1
+        try:
+            # Shield so one caller going away doesn't cancel the work for the others
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Once every caller has gone, nobody needs the result
+            if task in self._waiters:
+                self._waiters[task] -= 1
+                if not self._waiters[task]:
+                    task.cancel()
+            raise
+
+    def _release(self, key, task):
+        self._waiters.pop(task, None)
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def in_flight(self, key) -> bool:
+        return key in self._inflight
+
+
+# Keyed by (session_id, stage, *settings) for the analyze/generate/answers pipeline
+pipeline_calls = SingleFlight()
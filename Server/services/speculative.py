@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+from fastapi import HTTPException
+from services import metrics
+from services.admission import speculative_admission
+from services.executors import run_in
+from services.openai_service import generate_question_paper, generate_answers
+
+# Default for AnalyzeRequest.speculative when the client doesn't say
+SPECULATIVE_DEFAULT = os.getenv("SPECULATIVE_PIPELINE", "0").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+
+class Speculation:
+    """Background generate -> answers -> PDF chain started after an analysis.
+
+    Speculative calls are made without a user_id, so nothing is charged until an
+    endpoint actually consumes a result; work that is never used is cancelled
+    (or simply dropped) without charging credits. Each LLM step must get a slot
+    from `speculative_admission`; when none is free the chain stops and the
+    endpoint generates on demand instead.
+    """
+
+    def __init__(self, analysis: dict, owner: int, api_key: str = None):
+        self.analysis = analysis
+        self.owner = owner
+        self.api_key = api_key
+        self.paper = None
+        self.answers = None
+        self.paper_task: asyncio.Task | None = None
+        self.answers_task: asyncio.Task | None = None
+        self.pdfs: dict = {}
+        self.paper_consumed = False
+        self.answers_consumed = False
+
+    def start(self):
+        self.paper_task = asyncio.create_task(self._run_paper())
+        metrics.incr("speculative_started", stage="generate")
+
+    async def _run_paper(self) -> dict | None:
+        try:
+            async with speculative_admission.admit(self.owner):
+                paper = await generate_question_paper(self.analysis, api_key=self.api_key)
+        except HTTPException:
+            metrics.incr("speculative_skipped", stage="generate")
+            return None
+        self.paper = paper
+        self.answers_task = asyncio.create_task(self._run_answers(paper))
+        metrics.incr("speculative_started", stage="answers")
+        await self._render("questions", paper)
+        return paper
+
+    async def _run_answers(self, paper: dict) -> dict | None:
+        try:
+            async with speculative_admission.admit(self.owner):
+                answers = await generate_answers(paper, api_key=self.api_key)
+        except HTTPException:
+            metrics.incr("speculative_skipped", stage="answers")
+            return None
+        self.answers = answers
+        await self._render("answers", answers, paper.get("title", "Question Paper"))
+        return answers
+
+    async def _render(self, kind: str, source: dict, title: str = None):
+        try:
+            from services.pdf_generator import create_question_paper_pdf, create_answer_pdf
+            if kind == "questions":
+                pdf_bytes = await run_in("pdf", create_question_paper_pdf, source)
+            else:
+                pdf_bytes = await run_in("pdf", create_answer_pdf, source, paper_title=title)
+            self.pdfs[kind] = (source, pdf_bytes)
+        except Exception as e:
+            # A failed pre-render just means the download renders on demand
+            logger.warning("Speculative %s PDF render failed: %s", kind, e)
+
+    def cancel(self, answers_only: bool = False):
+        tasks = [self.answers_task] if answers_only else [self.paper_task, self.answers_task]
+        for task in tasks:
+            if task is not None and not task.done():
+                task.cancel()
+                metrics.incr("speculative_cancelled")
+            elif task is not None and not task.cancelled() and task.exception() is None and task.result() is not None:
+                consumed = self.answers_consumed if task is self.answers_task else self.paper_consumed
+                if not consumed:
+                    metrics.incr("speculative_unused")
+
+
+def start_speculation(session: dict):
+    """Start pre-generating the paper, answers and PDFs for the session's analysis."""
+    cancel_speculation(session)
+    speculation = Speculation(session["analysis"], session.get("user_id"), api_key=session.get("api_key"))
+    session["speculation"] = speculation
+    speculation.start()
+
+
+def cancel_speculation(session: dict, answers_only: bool = False):
+    speculation = session.get("speculation")
+    if speculation is None:
+        return
+    speculation.cancel(answers_only=answers_only)
+    if not answers_only:
+        session["speculation"] = None
+
+
+async def take_paper(session: dict) -> dict | None:
+    """Return the speculatively generated paper if it matches the current analysis."""
+    speculation = session.get("speculation")
+    if (
+        speculation is None
+        or speculation.paper_consumed
+        or speculation.paper_task is None
+        or speculation.analysis is not session.get("analysis")
+    ):
+        return None
+    speculation.paper_consumed = True
+    try:
+        # Shield so a caller going away doesn't cancel the background chain
+        paper = await asyncio.shield(speculation.paper_task)
+    except Exception as e:
+        logger.warning("Speculative paper generation failed, generating on demand: %s", e)
+        return None
+    if paper is None:
+        return None
+    metrics.incr("speculative_used", stage="generate")
+    return paper
+
+
+async def take_answers(session: dict) -> dict | None:
+    """Return speculatively generated answers if they belong to the current paper."""
+    speculation = session.get("speculation")
+    if (
+        speculation is None
+        or speculation.answers_consumed
+        or speculation.answers_task is None
+        or speculation.paper is not session.get("paper")
+    ):
+        return None
+    speculation.answers_consumed = True
+    try:
+        answers = await asyncio.shield(speculation.answers_task)
+    except Exception as e:
+        logger.warning("Speculative answer generation failed, generating on demand: %s", e)
+        return None
+    if answers is None:
+        return None
+    metrics.incr("speculative_used", stage="answers")
+    return answers
+
+
+def cached_pdf(session: dict, kind: str, source: dict) -> bytes | None:
+    """Pre-rendered PDF bytes, if they were rendered from exactly `source`."""
+    speculation = session.get("speculation")
+    if speculation is None or kind not in speculation.pdfs:
+        return None
+    rendered_from, pdf_bytes = speculation.pdfs[kind]
+    if rendered_from is not source:
+        return None
+    metrics.incr("speculative_used", stage=f"pdf_{kind}")
+    return pdf_bytes
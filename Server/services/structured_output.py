@@ -0,0 +1,192 @@
+import json
+import re
+import typing
+from functools import lru_cache
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+try:
+    import orjson
+
+    def fast_loads(content: str):
+        return orjson.loads(content)
+except ImportError:  # orjson is optional, fall back to the stdlib parser
+    def fast_loads(content: str):
+        return json.loads(content)
+
+JSON_BLOCK_START = r'^```(?:json)?\s*'
+JSON_BLOCK_END = r'\s*```$'
+
+
+def strip_code_fences(content: str) -> str:
+    content = (content or "").strip()
+    content = re.sub(JSON_BLOCK_START, '', content)
+    content = re.sub(JSON_BLOCK_END, '', content)
+    return content
+
+
+def response_format_for(model: type[BaseModel]) -> dict:
+    """Build an OpenAI `response_format` that constrains output to a schema model."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "schema": model.model_json_schema(),
+            # Dict fields (e.g. year_distribution) are not allowed in strict mode
+            "strict": False,
+        },
+    }
+
+
+def repair_truncated_json(content: str) -> str | None:
+    """Cut a truncated JSON document back to its last complete value and close it.
+
+    Returns the input unchanged if it is already balanced, or None if nothing
+    complete could be salvaged.
+    """
+    return _repair(content)[0]
+
+
+def _repair(content: str) -> tuple[str | None, tuple]:
+    # Also returns the containers that were still open where the document was cut
+    stack = []
+    in_string = False
+    escape = False
+    cut = None  # (index, open containers at that index)
+
+    for i, ch in enumerate(content):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            cut = (i + 1, tuple(stack))
+        elif ch == ",":
+            cut = (i, tuple(stack))
+
+    if not in_string and not stack:
+        return content, ()
+    if cut is None:
+        return None, ()
+
+    index, still_open = cut
+    head = content[:index].rstrip().rstrip(",")
+    closers = "".join("}" if c == "{" else "]" for c in reversed(still_open))
+    return head + closers, still_open
+
+
+@lru_cache(maxsize=None)
+def _adapter(annotation) -> TypeAdapter:
+    return TypeAdapter(annotation)
+
+
+def _list_item_type(annotation):
+    if typing.get_origin(annotation) in (list, typing.List):
+        args = typing.get_args(annotation)
+        return args[0] if args else None
+    return None
+
+
+def _dump(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    return value
+
+
+def validate_partial(data: dict, model: type[BaseModel]) -> tuple[dict, list[str]]:
+    """Validate `data` field by field against `model`.
+
+    List fields are validated item by item so one bad entry doesn't discard the
+    rest. Returns the cleaned data and the required fields that are still missing.
+    """
+    clean = {}
+    missing = []
+    for name, field in model.model_fields.items():
+        if name not in data:
+            if field.is_required():
+                missing.append(name)
+            continue
+
+        value = data[name]
+        item_type = _list_item_type(field.annotation)
+        if item_type is not None and isinstance(value, list):
+            adapter = _adapter(item_type)
+            items = []
+            for item in value:
+                try:
+                    items.append(_dump(adapter.validate_python(item)))
+                except ValidationError:
+                    continue
+            clean[name] = items
+            continue
+
+        try:
+            clean[name] = _dump(_adapter(field.annotation).validate_python(value))
+        except ValidationError:
+            if field.is_required():
+                missing.append(name)
+    return clean, missing
+
+
+def parse_structured(content: str, model: type[BaseModel]) -> tuple[dict, list[str], str | None]:
+    """Parse an LLM response into validated data.
+
+    Returns (data, missing_fields, truncated_field). Truncated output is repaired so
+    the complete items can be kept; `truncated_field` names the list that was being
+    written when the response was cut off, so only its remaining items need asking for.
+    It is only set when the cut fell inside that list. An item cut off part-way
+    through (e.g. a section whose questions list was still open), or a dict field
+    cut off part-way, is dropped so it is asked for again whole rather than kept
+    incomplete.
+    """
+    content = strip_code_fences(content)
+    truncated = False
+    still_open = ()
+    try:
+        data = fast_loads(content)
+    except ValueError:
+        repaired, still_open = _repair(content)
+        if repaired is None:
+            raise ValueError("Response did not contain any parseable JSON")
+        truncated = True
+        data = fast_loads(repaired)
+
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+
+    truncated_field = None
+    if truncated and len(still_open) > 1 and data:
+        # JSON objects keep their key order, so the last key is the one being written
+        last = next(reversed(data))
+        field = model.model_fields.get(last)
+        if still_open[1] == "[" and field is not None and _list_item_type(field.annotation) is not None:
+            truncated_field = last
+            if len(still_open) > 2 and data[last]:
+                # The cut was inside the list's last item
+                data[last].pop()
+        elif still_open[1] == "{":
+            # A dict field cut off part-way is asked for again whole
+            del data[last]
+
+    clean, missing = validate_partial(data, model)
+    return clean, missing, truncated_field
+
+
+def merge_continuation(data: dict, extra: dict) -> dict:
+    """Merge a continuation response into previously received data."""
+    merged = dict(data)
+    for key, value in extra.items():
+        if isinstance(value, list) and isinstance(merged.get(key), list):
+            merged[key] = merged[key] + value
+        elif key not in merged:
+            merged[key] = value
+    return merged
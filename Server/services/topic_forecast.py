@@ -0,0 +1,177 @@
+import os
+import re
+from collections import Counter, defaultdict
+import numpy as np
+from services.analysis_merge import _topic_key
+
+# Exams back at which a past appearance counts half as much as the latest one
+RECENCY_HALF_LIFE = float(os.getenv("FORECAST_RECENCY_HALF_LIFE", "3"))
+# How many top-ranked topics are reported as predicted_topics
+PREDICTED_TOPICS = int(os.getenv("FORECAST_PREDICTED_TOPICS", "8"))
+
+# Score = weighted sum of the three signals, each in [0, 1]
+WEIGHT_FREQUENCY = 0.45
+WEIGHT_DUE = 0.35
+WEIGHT_MARKS = 0.20
+
+_YEAR = re.compile(r"(?:19|20)\d{2}")
+
+
+def _parse_year(value) -> int | None:
+    match = _YEAR.search(str(value or ""))
+    return int(match.group()) if match else None
+
+
+def _build_matrices(analysis: dict):
+    """Topic × exam-year matrices of question counts and marks.
+
+    Only years that actually had a paper become columns, so a year without any
+    paper is not mistaken for a year the topic was skipped.
+    """
+    names: dict[str, str] = {}
+    counts: dict = defaultdict(Counter)
+    marks: dict = defaultdict(Counter)
+    years: set[int] = set()
+
+    for question in analysis.get("all_questions", []):
+        key = _topic_key(question.get("topic"))
+        year = _parse_year(question.get("year"))
+        if not key or year is None:
+            continue
+        names.setdefault(key, question["topic"].strip())
+        counts[key][year] += 1
+        marks[key][year] += max(question.get("marks") or 0, 0)
+        years.add(year)
+
+    # Topics the model reported with years but without matching questions still count as present
+    for topic in analysis.get("topics", []):
+        key = _topic_key(topic.get("topic"))
+        if not key:
+            continue
+        names.setdefault(key, topic["topic"].strip())
+        for year in filter(None, map(_parse_year, topic.get("years", []))):
+            years.add(year)
+            if not counts[key][year]:
+                counts[key][year] = 1
+
+    years.update(filter(None, map(_parse_year, analysis.get("year_distribution", {}))))
+    keys = [k for k in names if counts[k]]
+    year_axis = sorted(years)
+    column = {year: j for j, year in enumerate(year_axis)}
+
+    count_matrix = np.zeros((len(keys), len(year_axis)))
+    mark_matrix = np.zeros((len(keys), len(year_axis)))
+    for i, key in enumerate(keys):
+        for year, n in counts[key].items():
+            count_matrix[i, column[year]] = n
+            mark_matrix[i, column[year]] = marks[key][year]
+    return [names[k] for k in keys], year_axis, count_matrix, mark_matrix
+
+
+def _gap_statistics(present: np.ndarray):
+    """Per-topic mean and spread of the gaps (in exams) between appearances."""
+    n_topics, n_years = present.shape
+    columns = np.broadcast_to(np.arange(n_years), present.shape)
+    # Index of the latest appearance strictly before each column (-1 if none)
+    seen = np.where(present, columns, -1)
+    previous = np.concatenate(
+        [np.full((n_topics, 1), -1), np.maximum.accumulate(seen, axis=1)[:, :-1]], axis=1
+    )
+    has_gap = present & (previous >= 0)
+    gaps = np.where(has_gap, columns - previous, 0).astype(float)
+    n_gaps = has_gap.sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_gap = gaps.sum(axis=1) / n_gaps
+        spread = np.sqrt(np.where(has_gap, (gaps - mean_gap[:, None]) ** 2, 0).sum(axis=1) / n_gaps)
+    last_seen = np.where(present.any(axis=1), seen.max(axis=1), -1)
+    return mean_gap, np.nan_to_num(spread), n_gaps, last_seen
+
+
+def forecast_topics(analysis: dict) -> list[dict]:
+    """Rank topics by how likely they are to appear in the next paper.
+
+    Combines recency-weighted frequency, whether the topic is due given the
+    regularity of its past gaps, and its recency-weighted share of marks.
+    Returns one entry per topic, best first.
+    """
+    topics, year_axis, count_matrix, mark_matrix = _build_matrices(analysis)
+    if not topics or not year_axis:
+        return []
+
+    n_years = len(year_axis)
+    present = count_matrix > 0
+    # Weight 1 for the latest exam, halving every RECENCY_HALF_LIFE exams before it
+    age = np.arange(n_years - 1, -1, -1, dtype=float)
+    weights = 0.5 ** (age / RECENCY_HALF_LIFE)
+
+    frequency = present @ weights / weights.sum()
+
+    mean_gap, spread, n_gaps, last_seen = _gap_statistics(present)
+    # Exams between the last appearance and the paper being predicted
+    since = n_years - last_seen
+    regular = n_gaps >= 1
+    tolerance = np.maximum(spread, 0.5)
+    with np.errstate(invalid="ignore"):
+        early = np.exp(-0.5 * ((since - mean_gap) / tolerance) ** 2)
+        # Missing one cycle makes a topic fully due; missing several suggests it was
+        # dropped from the syllabus, so the score halves with every further cycle
+        missed = (since - mean_gap) / mean_gap
+        late = 0.5 ** np.maximum(missed - 1, 0)
+        closeness = np.where(since >= mean_gap, late, early)
+        # Regular cycles are trusted more than erratic ones
+        regularity = 1.0 / (1.0 + spread / mean_gap)
+    due = np.where(regular, np.nan_to_num(closeness * regularity), 0.0)
+    overdue = regular & (since > mean_gap + tolerance)
+
+    weighted_marks = mark_matrix @ weights
+    if not weighted_marks.sum():
+        # Papers without marks: fall back to the share of questions
+        weighted_marks = count_matrix @ weights
+    mark_share = weighted_marks / weighted_marks.sum()
+    relative_share = mark_share / mark_share.max()
+
+    score = WEIGHT_FREQUENCY * frequency + WEIGHT_DUE * due + WEIGHT_MARKS * relative_share
+    order = np.argsort(-score, kind="stable")
+
+    return [
+        {
+            "topic": topics[i],
+            "score": round(float(score[i]), 3),
+            "appearances": int(present[i].sum()),
+            "last_seen": str(year_axis[last_seen[i]]),
+            "mean_gap": round(float(mean_gap[i]), 2) if regular[i] else None,
+            "overdue": bool(overdue[i]),
+            "expected_mark_share": round(float(mark_share[i]), 3),
+        }
+        for i in order
+    ]
+
+
+def apply_forecast(analysis: dict) -> dict:
+    """Attach the ranked forecast and derive predicted_topics from it.
+
+    The model's own guesses are kept when the papers carry no usable years.
+    """
+    forecast = forecast_topics(analysis)
+    analysis["topic_forecast"] = forecast
+    if forecast:
+        analysis["predicted_topics"] = [t["topic"] for t in forecast[:PREDICTED_TOPICS]]
+    return analysis
+
+
+def paper_pattern(analysis: dict) -> list[dict]:
+    """Per-section question and mark counts of the analyzed papers, per paper on average."""
+    questions = analysis.get("all_questions", [])
+    papers = max(len({q.get("year") for q in questions if q.get("year")}), 1)
+    sections: dict = defaultdict(Counter)
+    for question in questions:
+        sections[question.get("section") or "-"][question.get("marks") or 0] += 1
+    return [
+        {
+            "section": name,
+            "questions_per_paper": round(sum(marks.values()) / papers, 1),
+            "marks": {str(m): n for m, n in sorted(marks.items())},
+        }
+        for name, marks in sorted(sections.items())
+    ]
@@ -0,0 +1,53 @@
+import os
+import time
+from database import get_db_connection
+
+# Set WARMUP=1 to pay the heavy setup cost at startup instead of on the first request
+WARMUP_ENABLED = os.getenv("WARMUP", "0").lower() in ("1", "true", "yes")
+
+_SAMPLE_PAPER = {
+    "title": "Warmup",
+    "subject": "Warmup",
+    "total_marks": 1,
+    "duration": "1 Hour",
+    "general_instructions": ["Warmup"],
+    "sections": [{
+        "name": "Section A",
+        "instructions": "Warmup",
+        "total_marks": 1,
+        "questions": [{"number": 1, "question": "Warmup", "marks": 1, "section": "A", "topic": "Warmup"}],
+    }],
+}
+
+
+def warmup() -> dict:
+    """Load heavy modules and build clients ahead of the first request.
+
+    Returns how long each step took, in seconds.
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    import fitz  # noqa: F401  PyMuPDF
+    from PIL import Image  # noqa: F401
+    timings["pdf_parser"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    from services.openai_service import get_default_client
+    get_default_client()
+    timings["openai_client"] = time.perf_counter() - started
+
+    # Rendering once loads ReportLab, its fonts and the sample stylesheets
+    started = time.perf_counter()
+    from services.pdf_generator import create_question_paper_pdf, create_answer_pdf
+    create_question_paper_pdf(_SAMPLE_PAPER)
+    create_answer_pdf({"answered_questions": [{"number": 1, "question": "Warmup", "marks": 1, "answer": "Warmup"}]})
+    timings["pdf_templates"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    conn = get_db_connection()
+    conn.cursor().execute("SELECT 1")
+    conn.close()
+    timings["database"] = time.perf_counter() - started
+
+    return timings